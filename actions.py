@@ -0,0 +1,379 @@
+import uuid
+import warnings
+from typing import Any, NamedTuple, Union
+
+from selenium.common.exceptions import JavascriptException
+
+from schema import Schema, compile_schema
+
+# Runs the steps of an ActionBatch in the page, starting at step arguments[1]. Steps in same-origin iframes run
+# through contentDocument; the script stops early at a step in a cross-origin iframe ('frame'), after a step that
+# navigates ('navigating', or 'navigated' when the page unloads) and after a failed step ('error').
+# Progress is kept in sessionStorage under the token arguments[2], so it survives a navigation that unloads
+# the page before the result reaches WebDriver.
+ACTION_SCRIPT = '''
+var steps = arguments[0], start = arguments[1], key = '__actionBatch:' + arguments[2];
+var done = arguments[arguments.length - 1];
+var results = [], finished = false;
+function save() {
+    try { sessionStorage.setItem(key, JSON.stringify({results: results, next: start + results.length})); }
+    catch (e) {}
+}
+function finish(next, reason) {
+    if (finished) return;
+    finished = true;
+    window.removeEventListener('beforeunload', unload);
+    if (reason !== 'navigated') {
+        try { sessionStorage.removeItem(key); } catch (e) {}
+    }
+    done({results: results, next: next, reason: reason});
+}
+function unload() { finish(start + results.length, 'navigated'); }
+window.addEventListener('beforeunload', unload);
+
+function frameDocument(step) {
+    var doc = document;
+    (step.frame || []).forEach(function (selector) {
+        if (doc === null) return;
+        var frame = doc.querySelector(selector);
+        if (!frame) throw new Error('frame ' + selector + ' not found');
+        try { doc = frame.contentDocument; } catch (e) { doc = null; }
+    });
+    return doc;
+}
+function find(doc, selector) {
+    var el = doc.querySelector(selector);
+    if (!el) throw new Error('element ' + selector + ' not found');
+    return el;
+}
+function visible(el) { return !!(el && (el.offsetWidth || el.offsetHeight || el.getClientRects().length)); }
+function fire(el, type, init) {
+    var Type = /^key/.test(type) ? KeyboardEvent : /^mouse/.test(type) ? MouseEvent : Event;
+    el.dispatchEvent(new Type(type, Object.assign({bubbles: true, cancelable: true}, init || {})));
+}
+function setValue(el, value) {
+    var proto = Object.getPrototypeOf(el), descriptor = Object.getOwnPropertyDescriptor(proto, 'value');
+    if (descriptor && descriptor.set) descriptor.set.call(el, value); else el.value = value;
+}
+function poll(check, timeout, next, error) {
+    var started = performance.now();
+    (function again() {
+        var value;
+        try { value = check(); } catch (e) { value = false; }
+        if (value) return next(true, null);
+        if (performance.now() - started >= timeout) return next(false, error);
+        setTimeout(again, 50);
+    })();
+}
+
+var ACTIONS = {
+    click: function (doc, step, next) {
+        var el = find(doc, step.selector);
+        el.scrollIntoView({block: 'center'});
+        ['mousedown', 'mouseup'].forEach(function (type) { fire(el, type); });
+        el.click();
+        next(true, null);
+    },
+    type: function (doc, step, next) {
+        var el = find(doc, step.selector);
+        el.focus();
+        if (step.clear) setValue(el, '');
+        Array.prototype.forEach.call(step.text, function (key) {
+            fire(el, 'keydown', {key: key});
+            setValue(el, el.value + key);
+            fire(el, 'input');
+            fire(el, 'keyup', {key: key});
+        });
+        fire(el, 'change');
+        next(true, null);
+    },
+    press: function (doc, step, next) {
+        var el = step.selector ? find(doc, step.selector) : doc.activeElement || doc.body;
+        fire(el, 'keydown', {key: step.key});
+        fire(el, 'keyup', {key: step.key});
+        if (step.key === 'Enter' && el.form) {
+            if (el.form.requestSubmit) el.form.requestSubmit(); else el.form.submit();
+        }
+        next(true, null);
+    },
+    select: function (doc, step, next) {
+        var el = find(doc, step.selector);
+        setValue(el, step.value);
+        fire(el, 'input');
+        fire(el, 'change');
+        next(el.value === step.value, el.value === step.value ? null : 'option ' + step.value + ' not found');
+    },
+    scroll: function (doc, step, next) {
+        var win = doc.defaultView, root = doc.scrollingElement || doc.documentElement;
+        if (step.selector) find(doc, step.selector).scrollIntoView({block: 'center'});
+        else if (step.by !== null) win.scrollBy(0, step.by);
+        else win.scrollTo(0, step.to === 'top' ? 0 : root.scrollHeight);
+        next(true, null);
+    },
+    wait: function (doc, step, next) { setTimeout(function () { next(true, null); }, step.timeout); },
+    wait_for: function (doc, step, next) {
+        poll(function () {
+            var el = doc.querySelector(step.selector);
+            return step.gone ? !el || (step.visible && !visible(el)) : el && (!step.visible || visible(el));
+        }, step.timeout, next, 'timed out waiting for ' + step.selector);
+    },
+    read: function (doc, step, next) {
+        var read = function (el) { return step.attribute ? el.getAttribute(step.attribute) : el.textContent; };
+        var value = step.multiple ? Array.prototype.map.call(doc.querySelectorAll(step.selector), read)
+                                  : read(find(doc, step.selector));
+        next(true, null, value);
+    },
+    extract: function (doc, step, next) {
+        next(true, null, new Function('document', step.script)(doc));
+    }
+};
+
+(function run(i) {
+    if (i >= steps.length) return finish(i, 'done');
+    var step = steps[i], started = performance.now(), doc;
+    var next = function (ok, error, value) {
+        if (finished) return;
+        results.push({ok: ok, error: error, value: value === undefined ? null : value,
+                      elapsed: performance.now() - started});
+        save();
+        if (!ok && !step.optional) return finish(i + 1, 'error');
+        if (ok && step.navigates) return finish(i + 1, 'navigating');
+        run(i + 1);
+    };
+    try {
+        doc = frameDocument(step);
+        if (doc === null) return finish(i, 'frame');
+        ACTIONS[step.action](doc, step, next);
+    } catch (e) {
+        next(false, String(e && e.message || e));
+    }
+})(start);
+'''
+# Reads and removes the progress ACTION_SCRIPT kept for token arguments[0]
+PROGRESS_SCRIPT = '''
+var key = '__actionBatch:' + arguments[0];
+try {
+    var progress = sessionStorage.getItem(key);
+    sessionStorage.removeItem(key);
+    return progress && JSON.parse(progress);
+} catch (e) {
+    return null;
+}
+'''
+
+
+class StepResult(NamedTuple):
+    action: str
+    selector: Union[str, None]
+    ok: bool
+    error: Union[str, None] = None
+    value: Any = None
+    elapsed: float = 0.0
+
+
+class ActionBatch:
+    '''
+    Sequence of page interactions that runs in the page with as few WebDriver round trips as possible
+    Steps are recorded with chained calls, e.g.
+        ActionBatch().click('#accept', frame='iframe#consent', optional=True).click('a.next', navigates=True)
+                     .wait_for('table tbody tr').extract({'rows': {'selector': 'tbody tr', 'multiple': True}})
+    and run with Browser.run_actions(batch), which returns a StepResult per step.
+    frame is a CSS selector of an iframe (or a list of them for nested iframes) the target is in, same-origin
+    frames need no extra round trips. Steps with optional=True may fail without stopping the batch.
+    Set navigates=True on steps that load a new page, the batch waits for it and continues there.
+    Clicks and typing are dispatched as DOM events by script.
+    '''
+    def __init__(self):
+        self.steps = []
+        self._schemas = {}
+
+    def __len__(self) -> int:
+        return len(self.steps)
+
+    def _add(self, action, selector=None, frame=None, optional=False, navigates=False, **params) -> 'ActionBatch':
+        frame = [frame] if isinstance(frame, str) else list(frame or [])
+        self.steps.append(dict(params, action=action, selector=selector, frame=frame, optional=optional,
+                               navigates=navigates))
+        return self
+
+    def click(self, selector, frame=None, optional=False, navigates=False) -> 'ActionBatch':
+        return self._add('click', selector, frame, optional, navigates)
+
+    def type(self, selector, text, clear=True, frame=None, optional=False) -> 'ActionBatch':
+        return self._add('type', selector, frame, optional, text=str(text), clear=clear)
+
+    def press(self, key, selector=None, frame=None, optional=False, navigates=False) -> 'ActionBatch':
+        '''
+        Function to press a key (e.g. 'Enter', which submits the form of the element) on an element
+        or the focused element
+        '''
+        return self._add('press', selector, frame, optional, navigates, key=key)
+
+    def select(self, selector, value, frame=None, optional=False) -> 'ActionBatch':
+        return self._add('select', selector, frame, optional, value=str(value))
+
+    def scroll(self, selector=None, to='bottom', by=None, frame=None) -> 'ActionBatch':
+        '''
+        Function to scroll an element into view, by a number of pixels or to the 'top' or 'bottom' of the page
+        '''
+        if to not in ('top', 'bottom'):
+            raise ValueError(f'The to parameter must be "top" or "bottom", not "{to}".')
+        return self._add('scroll', selector, frame, to=to, by=by)
+
+    def wait(self, seconds) -> 'ActionBatch':
+        return self._add('wait', timeout=seconds * 1000)
+
+    def wait_for(self, selector, timeout=10, visible=False, gone=False, frame=None,
+                 optional=False) -> 'ActionBatch':
+        '''
+        Function to wait until an element is present (and visible), or with gone=True until it disappeared
+        '''
+        return self._add('wait_for', selector, frame, optional, timeout=timeout * 1000, visible=visible, gone=gone)
+
+    def read(self, selector, attribute=None, multiple=False, frame=None, optional=False) -> 'ActionBatch':
+        '''
+        Function to read the text (or an attribute) of an element into the value of the step result
+        '''
+        return self._add('read', selector, frame, optional, attribute=attribute, multiple=multiple)
+
+    def extract(self, schema: Union[Schema, dict], frame=None, optional=False) -> 'ActionBatch':
+        '''
+        Function to extract a schema (see schema.Schema) into the value of the step result
+        '''
+        compiled = compile_schema(schema, self._schemas)
+        return self._add('extract', None, frame, optional, script=compiled.script, schema=compiled)
+
+    @staticmethod
+    def _budget(steps) -> float:
+        return sum(step.get('timeout', 0) for step in steps) / 1000 + 5
+
+    def _payload(self) -> list:
+        return [{key: value for key, value in step.items() if key != 'schema'} for step in self.steps]
+
+    @staticmethod
+    def _frame_steps(steps, index) -> list:
+        '''
+        Function to get the steps from index on that target the same frame, relative to that frame
+        '''
+        end = index
+        while end < len(steps) and steps[end]['frame'] == steps[index]['frame']:
+            end += 1
+        return [dict(step, frame=[]) for step in steps[index:end]]
+
+    @staticmethod
+    def _unloaded(e) -> None:
+        if 'unload' not in str(e):
+            raise e
+
+    @staticmethod
+    def _recovered(outcome, progress, steps) -> dict:
+        '''
+        Function to complete the outcome of a script that ended with a navigation from the progress it saved
+        '''
+        if outcome is not None:
+            return outcome
+        if progress is not None:
+            return dict(progress, reason='navigated')
+        warnings.warn('The page navigated during an action batch and its progress was lost, '
+                      'mark steps that navigate with navigates=True.', UserWarning)
+        return {'results': [], 'next': len(steps), 'reason': 'lost'}
+
+    def _execute(self, driver, steps, start, page_timeout) -> dict:
+        '''
+        Function to run steps from start in the current page or frame, waiting for the next page when it navigated
+        '''
+        token = uuid.uuid4().hex
+        try:
+            outcome = driver._execute_async_script(ACTION_SCRIPT, self._budget(steps[start:]), steps, start, token)
+        except JavascriptException as e:
+            outcome = self._unloaded(e)
+        if outcome is None or outcome['reason'] == 'navigated':
+            driver.wait_until_ready(timeout=page_timeout)
+            outcome = self._recovered(outcome, driver.execute_script(PROGRESS_SCRIPT, token), steps)
+        return outcome
+
+    async def _execute_async(self, driver, steps, start, page_timeout) -> dict:
+        token = uuid.uuid4().hex
+        try:
+            outcome = await driver._execute_async_script(ACTION_SCRIPT, self._budget(steps[start:]), steps, start,
+                                                         token)
+        except JavascriptException as e:
+            outcome = self._unloaded(e)
+        if outcome is None or outcome['reason'] == 'navigated':
+            await driver.wait_until_ready(timeout=page_timeout)
+            outcome = self._recovered(outcome, await driver.execute_script(PROGRESS_SCRIPT, token), steps)
+        return outcome
+
+    def run(self, driver, page_timeout=10) -> list:
+        '''
+        Function to run the batch on a Browser, one execute_async_script call unless steps navigate or
+        target cross-origin frames, which are switched to. page_timeout is the time in seconds to wait for
+        pages loaded by navigating steps. Stops at the first failed step that isn't optional,
+        the remaining steps get error 'skipped'.
+        '''
+        steps = self._payload()
+        results = []
+        index = 0
+        outcome = {'reason': 'done'}
+        while index < len(steps):
+            outcome = self._execute(driver, steps, index, page_timeout)
+            results += outcome['results']
+            index = outcome['next']
+            if outcome['reason'] == 'frame':
+                frame_steps = self._frame_steps(steps, index)
+                for selector in steps[index]['frame']:
+                    driver.switch_to.frame(driver.find_element_by_css_selector(selector))
+                try:
+                    outcome = self._execute(driver, frame_steps, 0, page_timeout)
+                finally:
+                    driver.switch_to.default_content()
+                results += outcome['results']
+                index += outcome['next']
+            if outcome['reason'] in ('error', 'lost'):
+                break
+            if outcome['reason'] == 'navigating':
+                driver.wait_until_ready(timeout=page_timeout)
+        return self._step_results(results, outcome['reason'] == 'lost')
+
+    async def run_async(self, driver, page_timeout=10) -> list:
+        '''
+        Function to run the batch on an AsyncBrowser, see run()
+        '''
+        steps = self._payload()
+        results = []
+        index = 0
+        outcome = {'reason': 'done'}
+        while index < len(steps):
+            outcome = await self._execute_async(driver, steps, index, page_timeout)
+            results += outcome['results']
+            index = outcome['next']
+            if outcome['reason'] == 'frame':
+                frame_steps = self._frame_steps(steps, index)
+                try:
+                    for selector in steps[index]['frame']:
+                        frame = await driver.command('POST', '/element', {'using': 'css selector', 'value': selector})
+                        await driver.command('POST', '/frame', {'id': frame})
+                    outcome = await self._execute_async(driver, frame_steps, 0, page_timeout)
+                finally:
+                    await driver.command('POST', '/frame', {'id': None})
+                results += outcome['results']
+                index += outcome['next']
+            if outcome['reason'] in ('error', 'lost'):
+                break
+            if outcome['reason'] == 'navigating':
+                await driver.wait_until_ready(timeout=page_timeout)
+        return self._step_results(results, outcome['reason'] == 'lost')
+
+    def _step_results(self, results, lost=False) -> list:
+        step_results = []
+        missing = 'unknown, progress was lost when the page navigated' if lost else 'skipped'
+        for step, result in zip(self.steps, results + [None] * (len(self.steps) - len(results))):
+            if result is None:
+                step_results.append(StepResult(step['action'], step['selector'], False, missing))
+                continue
+            value = result['value']
+            if step['action'] == 'extract' and result['ok'] and value is not None:
+                value = step['schema'].finish(value['data'], value['base'])
+            step_results.append(StepResult(step['action'], step['selector'], result['ok'], result['error'], value,
+                                           result['elapsed'] / 1000))
+        return step_results
@@ -0,0 +1,423 @@
+import asyncio
+import json
+import os
+import re
+import socket
+import time
+import warnings
+from typing import Any, Union
+from urllib.parse import urlsplit
+
+from selenium.common.exceptions import WebDriverException, JavascriptException, UnexpectedAlertPresentException, \
+    NoSuchElementException, InvalidSelectorException, InvalidArgumentException, TimeoutException, \
+    SessionNotCreatedException, NoSuchFrameException, StaleElementReferenceException
+
+from actions import ActionBatch
+from custom_chromedriver import BULK_ELEMENT_SCRIPT, DIRNAME_SCREENSHOTS, NETWORK_TRACKER_SCRIPT, READY_SCRIPT, \
+    SCREENSHOT_FORMATS, _write_screenshot, browser_options, error_handling
+from driver_cache import chromedriver_path
+from get_user_agents import random_ua
+from metrics import METRICS, Metrics
+from schema import Schema, compile_schema
+
+ELEMENT_KEY = 'element-6066-11e4-a52e-4f735466cecf'
+W3C_CAPABILITIES = ('browserName', 'browserVersion', 'platformName', 'acceptInsecureCerts', 'pageLoadStrategy',
+                    'proxy', 'timeouts', 'unhandledPromptBehavior', 'strictFileInteractability')
+W3C_ERRORS = {
+    'javascript error': JavascriptException,
+    'unexpected alert open': UnexpectedAlertPresentException,
+    'no such element': NoSuchElementException,
+    'invalid selector': InvalidSelectorException,
+    'invalid argument': InvalidArgumentException,
+    'timeout': TimeoutException,
+    'script timeout': TimeoutException,
+    'session not created': SessionNotCreatedException,
+    'no such frame': NoSuchFrameException,
+    'stale element reference': StaleElementReferenceException,
+}
+
+
+class _Connection:
+    '''
+    Minimal keep-alive HTTP/1.1 JSON client for talking to chromedriver from asyncio
+    '''
+    def __init__(self, url):
+        parts = urlsplit(url)
+        self.host = parts.hostname
+        self.port = parts.port or 80
+        self.prefix = parts.path.rstrip('/')
+        self._reader = None
+        self._writer = None
+        self._lock = asyncio.Lock()
+
+    async def request(self, method, path, payload=None) -> tuple:
+        body = json.dumps(payload).encode() if payload is not None else b''
+        head = (f'{method} {self.prefix}{path} HTTP/1.1\r\nHost: {self.host}:{self.port}\r\n'
+                f'Content-Type: application/json;charset=UTF-8\r\nContent-Length: {len(body)}\r\n'
+                f'Connection: keep-alive\r\n\r\n').encode()
+        async with self._lock:
+            for attempt in range(2):
+                reused = self._writer is not None
+                if not reused:
+                    self._reader, self._writer = await asyncio.open_connection(self.host, self.port)
+                try:
+                    self._writer.write(head + body)
+                    await self._writer.drain()
+                    return await self._response()
+                except (ConnectionError, asyncio.IncompleteReadError):
+                    self.close()
+                    if not reused or attempt:
+                        raise
+                except BaseException:
+                    # A cancelled or failed request leaves an unread response on the connection
+                    self.close()
+                    raise
+
+    async def _response(self) -> tuple:
+        status_line = await self._reader.readline()
+        if not status_line:
+            raise ConnectionResetError('Connection closed by chromedriver')
+        status = int(status_line.split()[1])
+        headers = {}
+        while True:
+            line = await self._reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            key, _, value = line.decode('latin-1').partition(':')
+            headers[key.strip().lower()] = value.strip()
+        if headers.get('transfer-encoding', '').lower() == 'chunked':
+            data = b''
+            while True:
+                size = int((await self._reader.readline()).split(b';')[0], 16)
+                if not size:
+                    await self._reader.readline()
+                    break
+                data += await self._reader.readexactly(size)
+                await self._reader.readline()
+        elif 'content-length' in headers:
+            data = await self._reader.readexactly(int(headers['content-length']))
+        else:
+            data = await self._reader.read()
+            headers['connection'] = 'close'
+        if headers.get('connection', '').lower() == 'close':
+            self.close()
+        return status, json.loads(data) if data else {}
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+        self._reader = self._writer = None
+
+
+class AsyncBrowser:
+    '''
+    asyncio counterpart of Browser talking the W3C WebDriver protocol to chromedriver directly
+    Create it with async_browser(). A shared asyncio.Semaphore passed as semaphore limits how many
+    WebDriver commands run at the same time over all sessions using it.
+    '''
+    def __init__(self, server_url, session_id, capabilities=None, semaphore: asyncio.Semaphore = None,
+                 service: asyncio.subprocess.Process = None):
+        self.server_url = server_url
+        self.session_id = session_id
+        self.capabilities = capabilities or {}
+        self.semaphore = semaphore
+        self.service = service
+        self.navigations = 0
+        self.script_timeout = 30
+        self._network_hook = None
+        self.metrics = Metrics(parent=METRICS)
+        self._schemas = {}
+        self._connection = _Connection(server_url)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.quit()
+
+    async def command(self, method, path, payload=None) -> Any:
+        '''
+        Function to send a WebDriver command for this session and return its value
+        Latency and errors are recorded in metrics per endpoint, e.g. "POST /element/{id}/click"
+        '''
+        name = f'{method} {re.sub(r"/element/[^/]+", "/element/{id}", path)}'
+        if path == '/goog/cdp/execute':
+            name += f':{payload["cmd"]}'
+        start = time.perf_counter()
+        try:
+            if self.semaphore is not None:
+                async with self.semaphore:
+                    status, response = await self._connection.request(method, f'/session/{self.session_id}{path}',
+                                                                      payload)
+            else:
+                status, response = await self._connection.request(method, f'/session/{self.session_id}{path}',
+                                                                  payload)
+            return _value(status, response)
+        except WebDriverException as e:
+            self.metrics.error(name, e)
+            raise
+        finally:
+            self.metrics.observe(name, time.perf_counter() - start)
+
+    async def get(self, url):
+        self.navigations += 1
+        await self.command('POST', '/url', {'url': url})
+
+    @property
+    async def current_url(self) -> str:
+        return await self.command('GET', '/url')
+
+    @property
+    async def page_source(self) -> str:
+        return await self.command('GET', '/source')
+
+    async def execute_script(self, script, *args) -> Any:
+        return await self.command('POST', '/execute/sync', {'script': script, 'args': list(args)})
+
+    async def execute_async_script(self, script, *args) -> Any:
+        return await self.command('POST', '/execute/async', {'script': script, 'args': list(args)})
+
+    async def execute_cdp_cmd(self, cmd, params=None) -> dict:
+        return await self.command('POST', '/goog/cdp/execute', {'cmd': cmd, 'params': params or {}})
+
+    async def set_timeouts(self, page_load=None, script=None, implicit=None):
+        '''
+        Function to set the page load, script and implicit wait timeouts in seconds
+        '''
+        timeouts = {name: int(value * 1000) for name, value in
+                    (('pageLoad', page_load), ('script', script), ('implicit', implicit)) if value is not None}
+        await self.command('POST', '/timeouts', timeouts)
+        if script is not None:
+            self.script_timeout = script
+
+    async def _execute_async_script(self, script, timeout, *args) -> Any:
+        '''
+        Function to run an async script that may take up to timeout seconds, raising the script timeout meanwhile
+        '''
+        script_timeout = self.script_timeout
+        if timeout + 5 > script_timeout:
+            await self.set_timeouts(script=timeout + 5)
+        try:
+            return await self.execute_async_script(script, *args)
+        finally:
+            if self.script_timeout != script_timeout:
+                await self.set_timeouts(script=script_timeout)
+
+    async def track_network(self):
+        '''
+        Function to count fetch/XHR requests from the start of every following document, see Browser.track_network()
+        '''
+        if self._network_hook is None:
+            self._network_hook = (await self.execute_cdp_cmd('Page.addScriptToEvaluateOnNewDocument',
+                                                             {'source': NETWORK_TRACKER_SCRIPT}))['identifier']
+
+    async def wait_until_ready(self, state='complete', network_idle=None, selector=None, script=None, timeout=10,
+                               poll=0.05) -> bool:
+        '''
+        Function to wait until the current page is ready, see Browser.wait_until_ready()
+        '''
+        options = {'state': state, 'idle': network_idle, 'selector': selector, 'predicate': bool(script),
+                   'timeout': timeout * 1000, 'poll': poll * 1000}
+        if network_idle is not None:
+            await self.track_network()
+        ready = await self._execute_async_script(READY_SCRIPT % (script or ''), timeout, options)
+        if not ready:
+            warnings.warn(f'Page {await self.current_url} was not ready after {timeout}s', UserWarning)
+        return bool(ready)
+
+    @error_handling
+    async def safe_get(self, url, not_found_selector=None, not_found_substring=None, sleep=None, state='complete',
+                       network_idle=None, selector=None, script=None, timeout=10):
+        '''
+        Funtion to retrieve url with built-in error handling
+        '''
+        if network_idle is not None:
+            await self.track_network()
+        await self.get(url)
+        if state or network_idle is not None or selector or script:
+            await self.wait_until_ready(state, network_idle, selector, script, timeout)
+        if sleep:
+            await asyncio.sleep(sleep)
+        if not_found_selector:
+            text = await self.execute_script('var el = document.querySelector(arguments[0]); '
+                                             'return el ? el.innerText : "";', not_found_selector)
+            if not_found_substring in text.strip():
+                warnings.warn(f'Page {url} not found', UserWarning)
+                return False
+        return True
+
+    async def find_elements(self, selector) -> list:
+        '''
+        Function to find elements by CSS selector, returns a list of WebDriver element ids
+        '''
+        elements = await self.command('POST', '/elements', {'using': 'css selector', 'value': selector})
+        return [element[ELEMENT_KEY] for element in elements]
+
+    @error_handling
+    async def get_element(self, selector, attributes=None, multiple=False, properties=None, text=False,
+                          as_dataframe=False) -> Union[list, str, None, Any]:
+        '''
+        Function to search for element with built-in error handling
+        Returns a list of element ids, a single element id or, when attributes, properties or text are requested,
+        a list of dictionaries collected in a single script call
+        '''
+        if attributes or properties or text:
+            output = await self.execute_script(BULK_ELEMENT_SCRIPT, {'selector': selector,
+                                                                     'attributes': list(attributes or []),
+                                                                     'properties': list(properties or []),
+                                                                     'text': bool(text)})
+            if as_dataframe:
+                import pandas as pd
+                return pd.DataFrame(output)
+            return output
+        elements = await self.find_elements(selector)
+        if multiple:
+            return elements
+        return elements[0] if elements else None
+
+    @error_handling
+    async def click_element(self, selector, iframe=False, iframe_selector='iframe'):
+        '''
+        Function to click an HTML element by its CSS selector, optionally inside an iframe
+        '''
+        try:
+            if iframe:
+                frame = await self.command('POST', '/element', {'using': 'css selector', 'value': iframe_selector})
+                await self.command('POST', '/frame', {'id': frame})
+            element = await self.command('POST', '/element', {'using': 'css selector', 'value': selector})
+            await self.command('POST', f'/element/{element[ELEMENT_KEY]}/click', {})
+        except NoSuchElementException:
+            warnings.warn('Could not click button, element not found in HTML.', UserWarning)
+        finally:
+            if iframe:
+                await self.command('POST', '/frame', {'id': None})
+
+    async def run_actions(self, batch: ActionBatch, page_timeout=10) -> list:
+        '''
+        Function to run an actions.ActionBatch in the page, see Browser.run_actions()
+        '''
+        return await batch.run_async(self, page_timeout)
+
+    @error_handling
+    async def extract(self, schema: Union[Schema, dict]) -> Union[dict, None]:
+        compiled = compile_schema(schema, self._schemas)
+        result = await self.execute_script(compiled.script)
+        return compiled.finish(result['data'], result['base'])
+
+    @error_handling
+    async def get_datalayer(self, name='dataLayer') -> Union[list, None]:
+        return await self.execute_script('return window[arguments[0]] === undefined ? null : window[arguments[0]];',
+                                         name)
+
+    async def capture_full_page(self, name=None, ext='png', quality=None, folder=DIRNAME_SCREENSHOTS) -> str:
+        '''
+        Function to create a full page screenshot through DevTools, see Browser.capture_full_page()
+        The file is written on a background thread, returns the file path
+        '''
+        if ext not in SCREENSHOT_FORMATS:
+            raise ValueError(f'The ext parameter must be one of {", ".join(SCREENSHOT_FORMATS)}, not "{ext}".')
+        if name is None:
+            name = str(asyncio.get_running_loop().time()).replace('.', '')
+        params = {'format': SCREENSHOT_FORMATS[ext], 'captureBeyondViewport': True, 'fromSurface': True}
+        if quality is not None and ext != 'png':
+            params['quality'] = quality
+        metrics = await self.execute_cdp_cmd('Page.getLayoutMetrics')
+        size = metrics.get('cssContentSize') or metrics['contentSize']
+        params['clip'] = {'x': 0, 'y': 0, 'width': size['width'], 'height': size['height'], 'scale': 1}
+        data = (await self.execute_cdp_cmd('Page.captureScreenshot', params))['data']
+        return await asyncio.wrap_future(_write_screenshot(data, os.path.join(folder, f'{name}.{ext}')))
+
+    async def quit(self):
+        '''
+        Function to end the session and stop chromedriver when it was started by async_browser()
+        Runs to completion even when the calling task is cancelled
+        '''
+        await asyncio.shield(self._quit())
+
+    async def _quit(self):
+        try:
+            if self.session_id:
+                await self._connection.request('DELETE', f'/session/{self.session_id}')
+        except (OSError, WebDriverException) as e:
+            warnings.warn(f'Could not quit browser session because of {e.__class__.__name__} - {e}', UserWarning)
+        finally:
+            self.session_id = None
+            self._connection.close()
+            if self.service is not None and self.service.returncode is None:
+                self.service.terminate()
+                await self.service.wait()
+
+
+def _value(status, response) -> Any:
+    '''
+    Function to unpack a WebDriver response and raise the matching selenium exception for errors
+    '''
+    value = response.get('value') if isinstance(response, dict) else None
+    if status >= 400 or (isinstance(value, dict) and 'error' in value):
+        error = value.get('error', '') if isinstance(value, dict) else ''
+        message = value.get('message', '') if isinstance(value, dict) else str(response)
+        raise W3C_ERRORS.get(error, WebDriverException)(message)
+    return value
+
+
+async def _start_chromedriver(timeout=20) -> tuple:
+    '''
+    Function to start chromedriver on a free port and wait until it accepts sessions
+    '''
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        port = s.getsockname()[1]
+    loop = asyncio.get_running_loop()
+    path = await loop.run_in_executor(None, chromedriver_path)
+    service = await asyncio.create_subprocess_exec(path, f'--port={port}',
+                                                   stdout=asyncio.subprocess.DEVNULL,
+                                                   stderr=asyncio.subprocess.DEVNULL)
+    url = f'http://127.0.0.1:{port}'
+    connection = _Connection(url)
+    deadline = loop.time() + timeout
+    try:
+        while True:
+            try:
+                status, response = await connection.request('GET', '/status')
+                if status == 200 and response.get('value', {}).get('ready'):
+                    return url, service
+            except OSError:
+                pass
+            if loop.time() > deadline or service.returncode is not None:
+                raise WebDriverException(f'chromedriver did not start within {timeout}s.')
+            await asyncio.sleep(0.05)
+    except BaseException:
+        if service.returncode is None:
+            service.terminate()
+        raise
+    finally:
+        connection.close()
+
+
+async def async_browser(maximize=False, user_agent=random_ua, headless=False, incognito=False, size=(),
+                        disable_scrollbar=False, server_url=None, semaphore: asyncio.Semaphore = None) -> AsyncBrowser:
+    '''
+    function to initialize an AsyncBrowser with the same options as browser()
+    Starts its own chromedriver unless server_url points to a running chromedriver (or a stand-in for it)
+    '''
+    # browser_options() may pick a user agent from disk or the network, which would block the event loop
+    options, d = await asyncio.get_running_loop().run_in_executor(
+        None, browser_options, maximize, user_agent, headless, incognito, size, disable_scrollbar)
+    capabilities = {key: value for key, value in {**d, **options.to_capabilities()}.items()
+                    if key in W3C_CAPABILITIES or ':' in key}
+
+    service = None
+    if server_url is None:
+        server_url, service = await _start_chromedriver()
+    connection = _Connection(server_url)
+    try:
+        status, response = await connection.request('POST', '/session',
+                                                    {'capabilities': {'alwaysMatch': capabilities}})
+        value = _value(status, response)
+    except BaseException:
+        if service is not None and service.returncode is None:
+            service.terminate()
+        raise
+    finally:
+        connection.close()
+    return AsyncBrowser(server_url, value['sessionId'], value.get('capabilities'), semaphore, service)
@@ -0,0 +1,132 @@
+import os
+import subprocess
+import sys
+import time
+from statistics import median
+
+from custom_chromedriver import Browser, browser
+
+DIRNAME_ORIGIN = os.path.dirname(os.path.realpath(__file__))
+
+# Dependencies that should only be imported when the feature that needs them is used
+HEAVY_MODULES = ('bs4', 'lxml', 'numpy', 'pandas', 'pynput', 'requests')
+LIGHT_MODULES = ('custom_chromedriver', 'browser_pool', 'crawler', 'get_user_agents', 'driver_cache', 'metrics',
+                 'frontier', 'parse_pool', 'schema', 'actions')
+
+
+def timed(func, *args, repeats=5, **kwargs) -> dict:
+    '''
+    Function to call func repeats times and return the best, median and worst duration in seconds
+    '''
+    durations = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        func(*args, **kwargs)
+        durations.append(time.perf_counter() - start)
+    return {'best': min(durations), 'median': median(durations), 'worst': max(durations)}
+
+
+def bench_get_element(driver: Browser, selector='a', attributes=('href', 'title', 'rel'), repeats=5) -> dict:
+    '''
+    Function to compare Browser.get_element in bulk mode (one execute_script call) with
+    the per-element path (one get_attribute round trip per attribute per element) on the current page
+    '''
+    elements = len(driver.find_elements_by_css_selector(selector))
+    results = {'elements': elements, 'attributes': len(attributes)}
+    for mode, bulk in (('bulk', True), ('per_element', False)):
+        results[mode] = timed(driver.get_element, selector, attributes=list(attributes), bulk=bulk, repeats=repeats)
+    results['speedup'] = results['per_element']['median'] / results['bulk']['median']
+    return results
+
+
+def bench_to_dataframe(rows=10000, columns=5, repeats=3) -> dict:
+    '''
+    Function to compare the bs4 and lxml engines of html_table_parse.to_dataframe on a generated table
+    '''
+    import bs4 as bs
+    from html_table_parse import to_dataframe
+
+    header = ''.join(f'<th>col {c}</th>' for c in range(columns))
+    body = ''.join('<tr>' + ''.join(f'<td>{r * c}</td>' for c in range(columns)) + '</tr>' for r in range(rows))
+    html = f'<table><tr>{header}</tr>{body}</table>'
+    table = bs.BeautifulSoup(html, 'lxml').select('table')[0]
+    results = {'rows': rows, 'columns': columns,
+               'bs4': timed(to_dataframe, table, engine='bs4', repeats=repeats),
+               'lxml': timed(to_dataframe, html, engine='lxml', repeats=repeats)}
+    results['speedup'] = results['bs4']['median'] / results['lxml']['median']
+    return results
+
+
+def bench_parse_pool(documents=16, rows=20000, workers=None) -> dict:
+    '''
+    Function to compare parsing documents with html_table_parse.all_tables in this process and in a ParsePool
+    '''
+    from html_table_parse import all_tables
+    from parse_pool import ParsePool
+
+    body = ''.join(f'<tr><td>{r}</td><td>row {r}</td><td><a href="/{r}">link</a></td></tr>' for r in range(rows))
+    docs = [f'<table><thead><tr><th>a</th><th>b</th><th>c</th></tr></thead><tbody>{body}</tbody></table>'] * documents
+    with ParsePool(workers) as pool:
+        results = {'documents': documents, 'bytes': len(docs[0]), 'workers': pool.workers,
+                   'serial': timed(lambda: [all_tables(d) for d in docs], repeats=1),
+                   'pool': timed(lambda: list(pool.map(all_tables, docs)), repeats=1)}
+    results['speedup'] = results['serial']['median'] / results['pool']['median']
+    return results
+
+
+def import_time(module) -> dict:
+    '''
+    Function to import module in a fresh interpreter with -X importtime
+    Returns the cumulative import time in milliseconds and the heavy dependencies that were imported
+    '''
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+                            capture_output=True, text=True, cwd=DIRNAME_ORIGIN)
+    if result.returncode:
+        raise ImportError(f'Could not import {module}:\n{result.stderr.splitlines()[-1]}')
+    total, imported = 0, set()
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or line.endswith('imported package'):
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        imported.add(name.strip().split('.')[0])
+        if name.strip() == module:
+            total = int(cumulative)
+    return {'module': module, 'ms': total / 1000, 'heavy': sorted(imported.intersection(HEAVY_MODULES))}
+
+
+def check_imports(modules=LIGHT_MODULES, budget_ms=None) -> list:
+    '''
+    Function to check that modules don't import heavy dependencies at import time and,
+    when budget_ms is given, import within that many milliseconds
+    Returns a list of problems, empty when all checks pass
+    '''
+    problems = []
+    for module in modules:
+        result = import_time(module)
+        if result['heavy']:
+            problems.append(f'{module} imports {", ".join(result["heavy"])} at import time')
+        if budget_ms is not None and result['ms'] > budget_ms:
+            problems.append(f'{module} took {result["ms"]:.1f}ms to import, budget is {budget_ms}ms')
+    return problems
+
+
+if __name__ == '__main__':
+    if sys.argv[1:2] == ['imports']:
+        budget = float(sys.argv[2]) if len(sys.argv) > 2 else None
+        for module in LIGHT_MODULES:
+            print(import_time(module))
+        problems = check_imports(budget_ms=budget)
+        print('\n'.join(problems) or 'Import checks passed')
+        sys.exit(1 if problems else 0)
+    elif sys.argv[1:2] == ['tables']:
+        print(bench_to_dataframe())
+    elif sys.argv[1:2] == ['parse']:
+        print(bench_parse_pool())
+    else:
+        url = sys.argv[1] if len(sys.argv) > 1 else 'https://en.wikipedia.org/wiki/Web_scraping'
+        driver = browser(headless=True)
+        try:
+            driver.safe_get(url)
+            print(bench_get_element(driver))
+        finally:
+            driver.quit()
@@ -0,0 +1,201 @@
+import threading
+import time
+import warnings
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Union
+
+from selenium.common.exceptions import WebDriverException
+
+from custom_chromedriver import Browser, browser
+
+
+class BrowserPool:
+    '''
+    Pool of warm Browser sessions that can be checked out and checked in again.
+    Sessions are recycled after max_navigations navigations or when older than max_age seconds
+    and are health checked before they are handed out.
+    Keyword arguments not used by the pool are passed on to browser().
+    '''
+    def __init__(self, size=2, max_navigations=None, max_age=None, health_check=True, warm=True,
+                 reset_cookies=False, **browser_kwargs):
+        if size < 1:
+            raise ValueError(f'The size parameter must be at least 1, not {size}.')
+        self.size = size
+        self.max_navigations = max_navigations
+        self.max_age = max_age
+        self.health_check = health_check
+        self.reset_cookies = reset_cookies
+        self.browser_kwargs = browser_kwargs
+        self._idle = []
+        self._in_use = set()
+        self._starting = 0
+        self._closed = False
+        self._lock = threading.Condition()
+        if warm:
+            try:
+                self.warm()
+            except BaseException:
+                self.close()
+                raise
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._idle) + len(self._in_use)
+
+    def _start(self) -> Browser:
+        return browser(**self.browser_kwargs)
+
+    def _expired(self, driver) -> bool:
+        if self.max_navigations is not None and driver.navigations >= self.max_navigations:
+            return True
+        if self.max_age is not None and time.monotonic() - driver.started >= self.max_age:
+            return True
+        return False
+
+    @staticmethod
+    def _quit(driver):
+        try:
+            driver.quit()
+        except WebDriverException as e:
+            warnings.warn(f'Could not quit browser session because of {e.__class__.__name__} - {e}', UserWarning)
+
+    def warm(self, amount=None):
+        '''
+        Function to start sessions in parallel until the pool holds amount (defaults to size) sessions
+        Sessions that started are kept when others fail, the first error is raised afterwards
+        '''
+        with self._lock:
+            missing = min(amount or self.size, self.size) - len(self._idle) - len(self._in_use) - self._starting
+            if missing <= 0:
+                return
+            self._starting += missing
+        drivers = []
+        errors = []
+        try:
+            with ThreadPoolExecutor(max_workers=missing) as executor:
+                for future in [executor.submit(self._start) for _ in range(missing)]:
+                    try:
+                        drivers.append(future.result())
+                    except Exception as e:
+                        errors.append(e)
+        finally:
+            with self._lock:
+                self._starting -= missing
+                closed = self._closed
+                if not closed:
+                    self._idle.extend(drivers)
+                self._lock.notify_all()
+            if closed:
+                for driver in drivers:
+                    self._quit(driver)
+        if errors:
+            raise errors[0]
+
+    def checkout(self, timeout=None) -> Browser:
+        '''
+        Function to borrow a healthy session from the pool, starting a new one when there is room.
+        Blocks for at most timeout seconds (or indefinitely) when all sessions are in use.
+        '''
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            with self._lock:
+                while True:
+                    if self._closed:
+                        raise RuntimeError('Cannot check out a session from a closed BrowserPool.')
+                    if self._idle:
+                        driver = self._idle.pop()
+                        self._in_use.add(driver)
+                        break
+                    if len(self._in_use) + self._starting < self.size:
+                        driver = None
+                        self._starting += 1
+                        break
+                    remaining = None if deadline is None else deadline - time.monotonic()
+                    if remaining is not None and remaining <= 0:
+                        raise TimeoutError(f'No browser session became available within {timeout}s.')
+                    self._lock.wait(remaining)
+
+            if driver is None:
+                try:
+                    driver = self._start()
+                finally:
+                    with self._lock:
+                        self._starting -= 1
+                        if driver is not None:
+                            self._in_use.add(driver)
+                        self._lock.notify_all()
+                return driver
+
+            if self._expired(driver) or (self.health_check and not driver.is_alive()):
+                self._discard(driver)
+                continue
+            return driver
+
+    def checkin(self, driver: Browser):
+        '''
+        Function to return a borrowed session to the pool, recycling it when it is expired or unhealthy
+        '''
+        with self._lock:
+            if driver not in self._in_use:
+                raise ValueError('Browser session was not checked out from this pool.')
+        if self._closed or self._expired(driver):
+            self._discard(driver)
+            return
+        if self.reset_cookies:
+            try:
+                driver.delete_all_cookies()
+            except WebDriverException:
+                self._discard(driver)
+                return
+        with self._lock:
+            self._in_use.discard(driver)
+            self._idle.append(driver)
+            self._lock.notify()
+
+    def discard(self, driver: Browser):
+        '''
+        Function to quit a borrowed session instead of returning it, e.g. after it crashed
+        '''
+        self._discard(driver)
+
+    def _discard(self, driver):
+        with self._lock:
+            self._in_use.discard(driver)
+            self._lock.notify()
+        self._quit(driver)
+
+    @contextmanager
+    def session(self, timeout=None) -> Union[Browser, None]:
+        '''
+        Context manager that checks out a session and checks it back in afterwards.
+        Sessions that raised a WebDriverException are discarded.
+        '''
+        driver = self.checkout(timeout)
+        try:
+            yield driver
+        except WebDriverException:
+            self._discard(driver)
+            raise
+        except BaseException:
+            self.checkin(driver)
+            raise
+        else:
+            self.checkin(driver)
+
+    def close(self):
+        '''
+        Function to quit all idle sessions, sessions in use are quit when they are checked in
+        '''
+        with self._lock:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            self._lock.notify_all()
+        for driver in idle:
+            self._quit(driver)
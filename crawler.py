@@ -0,0 +1,155 @@
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from itertools import islice
+from typing import Any, Callable, Iterable, Iterator, NamedTuple, Union
+
+from selenium.common.exceptions import TimeoutException, WebDriverException
+
+from browser_pool import BrowserPool
+from custom_chromedriver import Browser
+from frontier import Frontier, FrontierItem
+
+
+class CrawlResult(NamedTuple):
+    url: str
+    ok: bool
+    data: Any = None
+    error: Union[str, None] = None
+    attempts: int = 0
+    elapsed: float = 0.0
+
+
+def _release(pool: BrowserPool, driver, timeouts, keep):
+    '''
+    Function to restore the timeouts of a pooled session and hand it back, or discard it when it broke
+    '''
+    if keep and timeouts is not None:
+        try:
+            driver.set_page_load_timeout(timeouts[0])
+            driver.set_script_timeout(timeouts[1])
+        except WebDriverException:
+            keep = False
+    if keep:
+        pool.checkin(driver)
+    else:
+        pool.discard(driver)
+
+
+def _visit(pool: BrowserPool, url, extract, retries, timeout, safe_get_kwargs, backoff=1.0) -> CrawlResult:
+    '''
+    Function to retrieve a single url on a pooled session, retrying on failures after an exponential backoff
+    '''
+    start = time.monotonic()
+    error = None
+    for attempt in range(1, retries + 2):
+        if attempt > 1 and backoff:
+            time.sleep(backoff * 2 ** (attempt - 2))
+        try:
+            driver = pool.checkout()
+        except Exception as e:
+            error = f'{e.__class__.__name__} - could not start a browser session: {e}'
+            continue
+        timeouts = (driver.page_load_timeout, driver.script_timeout) if timeout else None
+        keep = True
+        try:
+            if timeout:
+                driver.set_page_load_timeout(timeout)
+                driver.set_script_timeout(timeout)
+            loaded = driver.safe_get(url, **safe_get_kwargs)
+            if loaded is False:
+                return CrawlResult(url, False, None, 'not found', attempt, time.monotonic() - start)
+            if loaded is None:
+                error = 'could not retrieve url'
+                continue
+            data = extract(driver) if extract else None
+            return CrawlResult(url, True, data, None, attempt, time.monotonic() - start)
+        except TimeoutException as e:
+            error = f'{e.__class__.__name__} - timed out after {timeout}s'
+        except WebDriverException as e:
+            error = f'{e.__class__.__name__} - {e}'
+            keep = False
+        except Exception as e:
+            error = f'{e.__class__.__name__} - {e}'
+        finally:
+            _release(pool, driver, timeouts, keep)
+    return CrawlResult(url, False, None, error, retries + 1, time.monotonic() - start)
+
+
+def crawl(urls: Iterable[str], workers=4, extract: Callable[[Browser], Any] = None, retries=1, timeout=30,
+          pool: BrowserPool = None, backoff=1.0, **safe_get_kwargs) -> Iterator[CrawlResult]:
+    '''
+    Function to retrieve urls with Browser.safe_get spread over a pool of workers.
+    Runs extract(driver) on every loaded page and yields a CrawlResult for each url as soon as it finishes,
+    so results do not come back in input order.
+    Every url is tried at most retries + 1 times, waiting backoff * 2 ** (retry - 1) seconds before each retry.
+    timeout (seconds) applies to page loads and scripts and the previous timeouts are restored afterwards.
+    Uses the given BrowserPool or starts a headless pool of size workers, remaining kwargs go to safe_get.
+    '''
+    own_pool = pool is None
+    if own_pool:
+        pool = BrowserPool(size=workers, headless=True)
+    urls = iter(urls)
+    executor = ThreadPoolExecutor(max_workers=workers)
+
+    def submit(batch):
+        return {executor.submit(_visit, pool, url, extract, retries, timeout, safe_get_kwargs, backoff)
+                for url in batch}
+
+    pending = set()
+    try:
+        pending = submit(islice(urls, workers * 2))
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            pending |= submit(islice(urls, len(done)))
+            for future in done:
+                yield future.result()
+    finally:
+        for future in pending:
+            future.cancel()
+        executor.shutdown(wait=True)
+        if own_pool:
+            pool.close()
+
+
+def crawl_frontier(frontier: Frontier, workers=4, extract: Callable[[Browser], Any] = None, timeout=30,
+                   pool: BrowserPool = None, **safe_get_kwargs) -> Iterator[CrawlResult]:
+    '''
+    Function to visit the urls of a Frontier with Browser.safe_get until none are left, like crawl()
+    Retries, backoff and per-domain politeness are left to the frontier, so several processes can run
+    crawl_frontier() on the same frontier and a crashed run resumes where it stopped.
+    extract may add the links it finds to the frontier.
+    '''
+    own_pool = pool is None
+    if own_pool:
+        pool = BrowserPool(size=workers, headless=True)
+    executor = ThreadPoolExecutor(max_workers=workers)
+
+    def visit(item: FrontierItem) -> CrawlResult:
+        result = _visit(pool, item.url, extract, 0, timeout, safe_get_kwargs)
+        if result.ok:
+            frontier.complete(item)
+        else:
+            frontier.fail(item, result.error, retry=result.error != 'not found')
+        return result._replace(attempts=item.attempts)
+
+    pending = {}
+    try:
+        while True:
+            while len(pending) < workers:
+                item = frontier.claim(timeout=0.1 if pending else None)
+                if item is None:
+                    break
+                pending[executor.submit(visit, item)] = item
+            if not pending:
+                break
+            done, _ = wait(pending, timeout=0.5, return_when=FIRST_COMPLETED)
+            for future in done:
+                del pending[future]
+                yield future.result()
+    finally:
+        for future, item in pending.items():
+            if future.cancel():
+                frontier.release(item)
+        executor.shutdown(wait=True)
+        if own_pool:
+            pool.close()
@@ -1,64 +1,607 @@
+import base64
+import inspect
+import json
 import pathlib
+import re
 import time
-import urllib.request
+import uuid
 import warnings
-import requests
-import bs4 as bs
 import os
+from collections import deque
 from selenium import webdriver
 from selenium.webdriver.chrome.webdriver import WebDriver
 from selenium.common.exceptions import SessionNotCreatedException, WebDriverException, JavascriptException, \
     UnexpectedAlertPresentException, NoSuchElementException, InvalidSelectorException, InvalidArgumentException
 from selenium.webdriver.remote.webelement import WebElement
-from sys import platform
-from zipfile import ZipFile
-from pynput.keyboard import Key, Controller
+from concurrent.futures import Future, ThreadPoolExecutor
 from datetime import datetime
+from actions import ActionBatch
+from driver_cache import MIRROR, chromedriver_path
 from get_user_agents import random_ua
-from typing import Any, Union
+from metrics import METRICS, Metrics
+from schema import Schema, compile_schema
+from typing import Any, Iterator, NamedTuple, Union
 
 DIRNAME = str(pathlib.Path().resolve())
 DIRNAME_ORIGIN = os.path.dirname(os.path.realpath(__file__))
 DIRNAME_SCREENSHOTS = f'{DIRNAME_ORIGIN}\\screenshots'
 
 
+def _extension_patterns(*extensions) -> list:
+    '''
+    Function to build URL patterns matching file extensions at the end of the path only, so that hostnames
+    like www.cssdesignawards.com are not matched by '.css'
+    '''
+    return [f'*/*.{extension}{suffix}' for extension in extensions for suffix in ('', '?*', '#*')]
+
+
+# URL patterns for DevTools Network.setBlockedURLs, per resource category
+BLOCK_CATEGORIES = {
+    'images': _extension_patterns('png', 'jpg', 'jpeg', 'gif', 'webp', 'avif', 'svg', 'ico', 'bmp'),
+    'fonts': _extension_patterns('woff', 'woff2', 'ttf', 'otf', 'eot'),
+    'media': _extension_patterns('mp4', 'webm', 'mp3', 'ogg', 'wav', 'm4a', 'mov', 'm3u8'),
+    'stylesheets': _extension_patterns('css'),
+    'ads': ['*doubleclick.net*', '*googlesyndication.com*', '*adservice.google.*', '*googleadservices.com*',
+            '*criteo.com*', '*criteo.net*', '*taboola.com*', '*outbrain.com*', '*adnxs.com*', '*amazon-adsystem.com*'],
+    'analytics': ['*google-analytics.com*', '*googletagmanager.com*', '*connect.facebook.net*', '*hotjar.com*',
+                  '*segment.io*', '*segment.com/analytics*', '*mixpanel.com*', '*scorecardresearch.com*',
+                  '*clarity.ms*', '*hs-analytics.net*'],
+}
+BLOCK_PRESETS = {
+    'text-only': ['images', 'fonts', 'media', 'stylesheets', 'ads', 'analytics'],
+    'analytics-audit': ['images', 'fonts', 'media', 'ads'],
+    'trackers': ['ads', 'analytics'],
+}
+# WebDriver errors that error_handling turns into warnings
+HANDLED_EXCEPTIONS = (JavascriptException, UnexpectedAlertPresentException, InvalidSelectorException,
+                      NoSuchElementException, InvalidArgumentException)
+SCREENSHOT_FORMATS = {'png': 'png', 'jpg': 'jpeg', 'jpeg': 'jpeg', 'webp': 'webp'}
+# Maximum number of structured log records kept per session until they are drained
+LOG_BUFFER_SIZE = 10000
+# Console messages start with the url and line:column of the script that logged them
+CONSOLE_SOURCE = re.compile(r'^(\S+) (\d+:\d+|-) ')
+
+_screenshot_writer = None
+_block_regexes = None
+
+# Counts the fetch/XHR requests in flight. Installed at document start by Browser.track_network() so requests
+# made while the page loads are counted too, READY_SCRIPT installs it late on pages loaded before that.
+NETWORK_TRACKER_SCRIPT = '''
+(function () {
+    if (window.__cdNetwork) return;
+    var net = window.__cdNetwork = {inflight: 0, last: performance.now()};
+    var track = function (delta) { net.inflight += delta; net.last = performance.now(); };
+    if (window.fetch) {
+        var fetch = window.fetch;
+        window.fetch = function () {
+            track(1);
+            return fetch.apply(this, arguments).finally(function () { track(-1); });
+        };
+    }
+    var send = XMLHttpRequest.prototype.send;
+    XMLHttpRequest.prototype.send = function () {
+        track(1);
+        this.addEventListener('loadend', function () { track(-1); });
+        return send.apply(this, arguments);
+    };
+})();
+'''
+
+# Waits inside the page until all requested readiness conditions hold or the timeout passes, so that
+# a wait costs a single WebDriver round trip. The custom predicate is inlined as a function body.
+READY_SCRIPT = '''
+var opts = arguments[0], done = arguments[arguments.length - 1];
+var predicate = function () { %s };
+var states = ['loading', 'interactive', 'complete'];
+if (opts.idle !== null) {''' + NETWORK_TRACKER_SCRIPT.replace('%', '%%') + '''}
+function idle() {
+    var net = window.__cdNetwork, last = net.last;
+    performance.getEntriesByType('resource').forEach(function (e) { last = Math.max(last, e.responseEnd); });
+    return net.inflight <= 0 && performance.now() - last >= opts.idle;
+}
+function ready() {
+    try {
+        return (opts.state === null || states.indexOf(document.readyState) >= states.indexOf(opts.state))
+            && (opts.selector === null || document.querySelector(opts.selector) !== null)
+            && (opts.idle === null || idle())
+            && (!opts.predicate || !!predicate());
+    } catch (e) {
+        return false;
+    }
+}
+var started = performance.now(), observer = null, timer = null;
+function check() {
+    var ok = ready();
+    if (ok || performance.now() - started >= opts.timeout) {
+        if (observer) observer.disconnect();
+        clearInterval(timer);
+        done(ok);
+        check = function () {};
+    }
+}
+if (opts.selector !== null) {
+    observer = new MutationObserver(function () { check(); });
+    observer.observe(document, {childList: true, subtree: true});
+}
+timer = setInterval(function () { check(); }, opts.poll);
+check();
+'''
+
+# Reads the requested attributes, properties and text of an element into a record.
+# Attributes are read like WebElement.get_attribute does: the property when it holds a plain value,
+# otherwise the HTML attribute.
+ELEMENT_RECORD_FUNCTION = '''
+function elementRecord(el, spec) {
+    var record = {};
+    spec.attributes.forEach(function (name) {
+        var value = el[name];
+        record[name] = (value === undefined || value === null || typeof value === 'object'
+                        || typeof value === 'function') ? el.getAttribute(name) : value;
+    });
+    spec.properties.forEach(function (name) { record[name] = el[name]; });
+    if (spec.text) record.text = el.innerText;
+    return record;
+}
+'''
+
+# Collects attributes, properties and text of all elements matching a selector in one round trip
+BULK_ELEMENT_SCRIPT = ELEMENT_RECORD_FUNCTION + '''
+var spec = arguments[0];
+return Array.prototype.map.call(document.querySelectorAll(spec.selector), function (el) {
+    return elementRecord(el, spec);
+});
+'''
+
+# Scrolls to the bottom once and waits until batch new elements matching the selector were added or the DOM
+# was quiet for idle milliseconds. A MutationObserver kept on the page between calls buffers the added
+# elements, so earlier content is never read again. Returns the records of at most batch buffered elements.
+HARVEST_SCRIPT = ELEMENT_RECORD_FUNCTION + '''
+var spec = arguments[0], done = arguments[arguments.length - 1];
+var root = document.scrollingElement || document.documentElement;
+var state = window.__cdHarvest;
+if (!state || state.selector !== spec.selector) {
+    if (state) state.observer.disconnect();
+    state = window.__cdHarvest = {selector: spec.selector, buffer: [], seen: new WeakSet(), last: performance.now()};
+    var add = function (el) {
+        if (!state.seen.has(el)) { state.seen.add(el); state.buffer.push(el); }
+    };
+    var collect = function (node) {
+        if (node.nodeType !== 1 || !spec.selector) return;
+        if (node.matches(spec.selector)) add(node);
+        Array.prototype.forEach.call(node.querySelectorAll(spec.selector), add);
+    };
+    state.observer = new MutationObserver(function (mutations) {
+        state.last = performance.now();
+        mutations.forEach(function (m) { Array.prototype.forEach.call(m.addedNodes, collect); });
+    });
+    state.observer.observe(document.documentElement, {childList: true, subtree: true});
+    if (spec.existing) collect(document.documentElement);
+}
+var height = root.scrollHeight, started = performance.now();
+state.last = started;
+window.scrollTo(0, root.scrollHeight);
+(function check() {
+    var now = performance.now();
+    if (state.buffer.length < spec.batch && now - state.last < spec.idle && now - started < spec.timeout) {
+        return setTimeout(check, 50);
+    }
+    done({
+        records: state.buffer.splice(0, spec.batch).map(function (el) { return elementRecord(el, spec); }),
+        pending: state.buffer.length,
+        height: root.scrollHeight,
+        grew: root.scrollHeight > height
+    });
+})();
+'''
+
+# Waits for the load event to finish and returns Navigation Timing and summed Resource Timing data
+NAVIGATION_TIMING_SCRIPT = '''
+var timeout = arguments[0], done = arguments[arguments.length - 1], started = performance.now();
+(function collect() {
+    var nav = performance.getEntriesByType('navigation')[0];
+    if ((!nav || nav.loadEventEnd <= 0) && performance.now() - started < timeout) {
+        return setTimeout(collect, 50);
+    }
+    if (!nav) return done(null);
+    var resources = performance.getEntriesByType('resource'), transfer = 0, encoded = 0, cached = 0;
+    resources.forEach(function (r) {
+        transfer += r.transferSize;
+        encoded += r.encodedBodySize;
+        if (r.transferSize === 0 && r.decodedBodySize > 0) cached += 1;
+    });
+    done({
+        ttfb: nav.responseStart - nav.startTime,
+        dns: nav.domainLookupEnd - nav.domainLookupStart,
+        connect: nav.connectEnd - nav.connectStart,
+        response: nav.responseEnd - nav.responseStart,
+        dom_interactive: nav.domInteractive - nav.startTime,
+        dom_content_loaded: nav.domContentLoadedEventEnd - nav.startTime,
+        load: nav.loadEventEnd - nav.startTime,
+        transfer_size: nav.transferSize,
+        encoded_body_size: nav.encodedBodySize,
+        decoded_body_size: nav.decodedBodySize,
+        resources: resources.length,
+        resources_cached: cached,
+        resources_transfer_size: transfer,
+        resources_encoded_body_size: encoded
+    });
+})();
+'''
+
+# Installed at document start, records every push to the dataLayer variable with a timestamp in a bounded
+# buffer. Reassigning the variable or replacing its push method (as tag managers
+# do) keeps the hook in place.
+DATALAYER_HOOK_SCRIPT = '''
+(function () {
+    if (window.__cdDataLayer) return;
+    var buffer = window.__cdDataLayer = {events: [], dropped: 0, max: %(max_events)d};
+    var record = function (item) {
+        var value;
+        try { value = JSON.parse(JSON.stringify(item)); } catch (e) { value = String(item); }
+        if (buffer.events.length >= buffer.max) { buffer.events.shift(); buffer.dropped += 1; }
+        buffer.events.push({timestamp: Date.now(), url: location.href, event: value});
+    };
+    var hook = function (layer) {
+        if (!Array.isArray(layer) || layer.__cdHooked) return layer;
+        Array.prototype.forEach.call(layer, record);
+        var push = layer.push, busy = false;
+        // A replaced push method usually calls the one it replaced (this wrapper), which then pushes natively
+        var wrapped = function () {
+            if (busy) return Array.prototype.push.apply(layer, arguments);
+            busy = true;
+            try {
+                Array.prototype.forEach.call(arguments, record);
+                return push.apply(layer, arguments);
+            } finally {
+                busy = false;
+            }
+        };
+        Object.defineProperty(layer, '__cdHooked', {value: true});
+        Object.defineProperty(layer, 'push', {
+            configurable: true,
+            get: function () { return wrapped; },
+            set: function (fn) { push = fn; }
+        });
+        return layer;
+    };
+    var current = hook(window['%(name)s']);
+    try {
+        Object.defineProperty(window, '%(name)s', {
+            configurable: true,
+            get: function () { return current; },
+            set: function (value) { current = hook(value); }
+        });
+    } catch (e) {}
+})();
+'''
+
+# Takes all recorded dataLayer pushes out of the in-page buffer
+DATALAYER_DRAIN_SCRIPT = '''
+var buffer = window.__cdDataLayer;
+if (!buffer) return null;
+var drained = {events: buffer.events, dropped: buffer.dropped};
+buffer.events = [];
+buffer.dropped = 0;
+return drained;
+'''
+
+
+class LogRecord(NamedTuple):
+    timestamp: float
+    level: str
+    source: str
+    url: Union[str, None]
+    message: str
+    network: Union[dict, None]
+
+
+def _console_record(entry) -> LogRecord:
+    '''
+    Function to turn an entry of the browser log into a LogRecord
+    '''
+    match = CONSOLE_SOURCE.match(entry['message'])
+    return LogRecord(entry['timestamp'], entry['level'], entry.get('source', 'console'),
+                     match.group(1) if match else None, entry['message'], None)
+
+
+def _response_fields(response) -> dict:
+    timing = response.get('timing')
+    return {'status': response.get('status'), 'mime_type': response.get('mimeType'),
+            'protocol': response.get('protocol'), 'remote_ip': response.get('remoteIPAddress'),
+            'from_cache': response.get('fromDiskCache', False) or response.get('fromServiceWorker', False),
+            'ttfb': timing['receiveHeadersEnd'] - timing['sendStart'] if timing else None}
+
+
+def _request_record(request, ended) -> LogRecord:
+    '''
+    Function to turn the combined Network events of a request into a LogRecord, times are in milliseconds
+    '''
+    network = dict(request)
+    network['duration'] = (ended - network.pop('started')) * 1000
+    wall_time = network.pop('wall_time')
+    if network.get('blocked_reason'):
+        level, message = 'WARNING', f'{network["method"]} {network["url"]} blocked ({network["blocked_reason"]})'
+    elif network.get('error'):
+        level, message = 'SEVERE', f'{network["method"]} {network["url"]} failed ({network["error"]})'
+    else:
+        level = 'SEVERE' if (network.get('status') or 0) >= 400 else 'INFO'
+        message = f'{network["method"]} {network["url"]} {network.get("status")}'
+    return LogRecord(wall_time * 1000 if wall_time else None, level, 'network', network['url'], message, network)
+
+
 def error_handling(func) -> Any:
     '''
     Wrapper function for handling errors in JavaScript execution
+    Works for both regular functions and coroutine functions
     '''
+    if inspect.iscoroutinefunction(func):
+        async def async_wrapper(*args, **kwargs):
+            try:
+                return await func(*args, **kwargs)
+            except WebDriverException as e:
+                _handle_error(func, e, args[0] if args else None)
+        return async_wrapper
+
     def wrapper(*args, **kwargs):
         try:
             val = func(*args, **kwargs)
             return val
-        except (JavascriptException, UnexpectedAlertPresentException) as e:
-            func_name = func.__name__.replace('_', ' ')
-            warnings.warn(f'Could not {func_name} because of {e.__class__.__name__} - {e}', UserWarning)
-        except (InvalidSelectorException, NoSuchElementException) as e:
-            func_name = func.__name__.replace('_', ' ')
-            warnings.warn(f'Could not {func_name} because element doesn\'t exist or given selector is not valid\n'
-                          f' {e.__class__.__name__} - {e}', UserWarning)
-        except InvalidArgumentException as e:
-            warnings.warn(f'Could not retrieve url because it probably doesn\'t exist\n'
-                          f'{e.__class__.__name__} - {e}', UserWarning)
+        except WebDriverException as e:
+            _handle_error(func, e, args[0] if args else None)
     return wrapper
 
 
+def _handle_error(func, e, instance=None):
+    '''
+    Function to turn handled WebDriver errors into warnings and re-raise all others
+    Handled errors are counted in the metrics of the instance (or the process wide METRICS)
+    '''
+    if not isinstance(e, HANDLED_EXCEPTIONS):
+        raise e
+    getattr(instance, 'metrics', METRICS).handled_error(func.__name__, e)
+    if isinstance(e, (JavascriptException, UnexpectedAlertPresentException)):
+        func_name = func.__name__.replace('_', ' ')
+        warnings.warn(f'Could not {func_name} because of {e.__class__.__name__} - {e}', UserWarning)
+    elif isinstance(e, (InvalidSelectorException, NoSuchElementException)):
+        func_name = func.__name__.replace('_', ' ')
+        warnings.warn(f'Could not {func_name} because element doesn\'t exist or given selector is not valid\n'
+                      f' {e.__class__.__name__} - {e}', UserWarning)
+    else:
+        warnings.warn(f'Could not retrieve url because it probably doesn\'t exist\n'
+                      f'{e.__class__.__name__} - {e}', UserWarning)
+
+
 class Browser(WebDriver):
     '''
     Subclass of selenium.webdriver.chrome.webdriver.WebDriver
     '''
     def __init__(self, *args, **kwargs):
+        self.metrics = Metrics(parent=METRICS)
         super(Browser, self).__init__(*args, **kwargs)
         self.kwargs = kwargs
         self.options = self.kwargs['options']
+        self.started = time.monotonic()
+        self.navigations = 0
+        self.script_timeout = 30
+        self.page_load_timeout = 300
+        self._cache_identity = None
+        self.blocked_patterns = []
+        self._blocked_counts = {}
+        self._log_sources = list(kwargs.get('desired_capabilities', {}).get('goog:loggingPrefs', {}))
+        self.logs = deque(maxlen=LOG_BUFFER_SIZE)
+        self.logs_dropped = 0
+        self._pending_requests = {}
+        self._schemas = {}
+        self._network_hook = None
+        self._datalayer_hook = None
+        self._datalayer_events = deque()
+        self.datalayer_dropped = 0
+
+    def execute(self, driver_command, params=None):
+        '''
+        Runs every WebDriver command and records its round trip latency and errors in metrics
+        DevTools commands are recorded per DevTools method, e.g. executeCdpCommand:Page.captureScreenshot
+        '''
+        command = driver_command
+        if driver_command == 'executeCdpCommand' and params:
+            command = f'{driver_command}:{params.get("cmd")}'
+        start = time.perf_counter()
+        try:
+            return super(Browser, self).execute(driver_command, params)
+        except WebDriverException as e:
+            self.metrics.error(command, e)
+            raise
+        finally:
+            self.metrics.observe(command, time.perf_counter() - start)
+
+    def set_script_timeout(self, time_to_wait):
+        '''
+        Sets the script timeout and remembers it so it can be restored after longer waits
+        '''
+        self.script_timeout = time_to_wait
+        super(Browser, self).set_script_timeout(time_to_wait)
+
+    def set_page_load_timeout(self, time_to_wait):
+        '''
+        Sets the page load timeout and remembers it so it can be restored, e.g. by crawl() on pooled sessions
+        '''
+        self.page_load_timeout = time_to_wait
+        super(Browser, self).set_page_load_timeout(time_to_wait)
+
+    def get(self, url):
+        '''
+        Navigates to url and keeps count of the navigations made by this session
+        '''
+        self.navigations += 1
+        if self.blocked_patterns:
+            self._collect_logs()
+            self._blocked_counts = {}
+        if self._datalayer_hook is not None:
+            self._drain_page_datalayer()
+        super(Browser, self).get(url)
+
+    def block_resources(self, block):
+        '''
+        Function to block requests through DevTools Network.setBlockedURLs
+        block can be a preset from BLOCK_PRESETS, a category from BLOCK_CATEGORIES, a URL pattern with * wildcards
+        or a list of those. Pass None or an empty list to unblock everything.
+        '''
+        self.blocked_patterns = block_patterns(block)
+        self.execute_cdp_cmd('Network.enable', {})
+        self.execute_cdp_cmd('Network.setBlockedURLs', {'urls': self.blocked_patterns})
+
+    def blocked_requests(self) -> dict:
+        '''
+        Function to count the requests blocked on the current page per category (or 'other' for custom patterns)
+        Needs the performance log, which browser(block=...) enables
+        '''
+        self._collect_logs()
+        return dict(self._blocked_counts, total=sum(self._blocked_counts.values()))
+
+    def drain_logs(self, source=None) -> list:
+        '''
+        Function to collect the browser (console) and performance logs as LogRecords and empty the log buffer
+        With a source (e.g. 'javascript', 'console-api' or 'network') only those records are taken out of the buffer.
+        Network records hold one finished or failed request each, with its timings in network,
+        this needs the performance log (browser(performance_log=True)).
+        '''
+        self._collect_logs()
+        if source is None:
+            records = list(self.logs)
+            self.logs.clear()
+            return records
+        records = [record for record in self.logs if record.source == source]
+        kept = [record for record in self.logs if record.source != source]
+        self.logs.clear()
+        self.logs.extend(kept)
+        return records
+
+    def _collect_logs(self):
+        '''
+        Function to move all new entries of the enabled logs from the driver into the log buffer
+        '''
+        records = []
+        for log_type in self._log_sources:
+            try:
+                entries = self.get_log(log_type)
+            except WebDriverException:
+                continue
+            if log_type == 'performance':
+                for entry in entries:
+                    record = self._network_record(json.loads(entry['message'])['message'])
+                    if record is not None:
+                        records.append(record)
+            else:
+                records += [_console_record(entry) for entry in entries]
+        if len(self._pending_requests) > 10000:
+            self._pending_requests.clear()
+        overflow = len(self.logs) + len(records) - self.logs.maxlen
+        self.logs_dropped += max(overflow, 0)
+        self.logs.extend(records)
+
+    def _network_record(self, message) -> Union['LogRecord', None]:
+        '''
+        Function to combine the DevTools Network events of a request, returns a LogRecord when the request ended
+        '''
+        method = message.get('method', '')
+        params = message.get('params', {})
+        request_id = params.get('requestId')
+        if method == 'Network.requestWillBeSent':
+            previous = self._pending_requests.get(request_id)
+            self._pending_requests[request_id] = {
+                'url': params['request']['url'], 'method': params['request']['method'], 'type': params.get('type'),
+                'started': params['timestamp'], 'wall_time': params.get('wallTime')}
+            if previous is not None and params.get('redirectResponse'):
+                previous.update(_response_fields(params['redirectResponse']))
+                return _request_record(previous, params['timestamp'])
+        elif request_id not in self._pending_requests:
+            return None
+        elif method == 'Network.responseReceived':
+            self._pending_requests[request_id].update(_response_fields(params['response']))
+        elif method == 'Network.requestServedFromCache':
+            self._pending_requests[request_id]['from_cache'] = True
+        elif method == 'Network.loadingFinished':
+            request = self._pending_requests.pop(request_id)
+            request['encoded_data_length'] = params.get('encodedDataLength')
+            return _request_record(request, params['timestamp'])
+        elif method == 'Network.loadingFailed':
+            request = self._pending_requests.pop(request_id)
+            request['error'] = params.get('errorText')
+            request['blocked_reason'] = params.get('blockedReason')
+            if request['blocked_reason']:
+                category = _block_category(request['url'])
+                self._blocked_counts[category] = self._blocked_counts.get(category, 0) + 1
+            return _request_record(request, params['timestamp'])
+        return None
+
+    def is_alive(self) -> bool:
+        '''
+        Function to check whether the session and the browser behind it still respond
+        '''
+        try:
+            self.execute_script('return 1;')
+            return True
+        except WebDriverException:
+            return False
+
+    def _execute_async_script(self, script, timeout, *args) -> Any:
+        '''
+        Function to run an async script that may take up to timeout seconds, raising the script timeout meanwhile
+        '''
+        script_timeout = self.script_timeout
+        if timeout + 5 > script_timeout:
+            self.set_script_timeout(timeout + 5)
+        try:
+            return self.execute_async_script(script, *args)
+        finally:
+            if self.script_timeout != script_timeout:
+                self.set_script_timeout(script_timeout)
+
+    def track_network(self):
+        '''
+        Function to count fetch/XHR requests from the start of every following document, so that
+        wait_until_ready(network_idle=...) also sees the requests made while the page was loading
+        '''
+        if self._network_hook is None:
+            self._network_hook = self.execute_cdp_cmd('Page.addScriptToEvaluateOnNewDocument',
+                                                      {'source': NETWORK_TRACKER_SCRIPT})['identifier']
+
+    def wait_until_ready(self, state='complete', network_idle=None, selector=None, script=None, timeout=10,
+                         poll=0.05) -> bool:
+        '''
+        Function to wait until the current page is ready instead of sleeping a fixed amount of time
+        All given conditions must hold:
+            state: minimal document.readyState ('interactive' or 'complete')
+            network_idle: milliseconds without fetch/XHR/resource activity
+            selector: CSS selector of an element that must be present
+            script: JavaScript function body that must return a truthy value
+        Returns False and warns when the page was not ready within timeout seconds
+        '''
+        if state not in (None, 'loading', 'interactive', 'complete'):
+            raise ValueError(f'The state parameter must be "interactive" or "complete", not "{state}".')
+        options = {'state': state, 'idle': network_idle, 'selector': selector, 'predicate': bool(script),
+                   'timeout': timeout * 1000, 'poll': poll * 1000}
+        if network_idle is not None:
+            self.track_network()
+        ready = self._execute_async_script(READY_SCRIPT % (script or ''), timeout, options)
+        if not ready:
+            warnings.warn(f'Page {self.current_url} was not ready after {timeout}s', UserWarning)
+        return bool(ready)
 
     @error_handling
-    def safe_get(self, url, not_found_selector=None, not_found_substring=None, sleep=1):
+    def safe_get(self, url, not_found_selector=None, not_found_substring=None, sleep=None, state='complete',
+                 network_idle=None, selector=None, script=None, timeout=10):
         '''
         Funtion to retrieve url with built-in error handling
+        Waits for the page with wait_until_ready(), sleep adds an optional fixed delay on top of that
         '''
+        if network_idle is not None:
+            self.track_network()
         self.get(url)
-        time.sleep(sleep)
+        if state or network_idle is not None or selector or script:
+            self.wait_until_ready(state, network_idle, selector, script, timeout)
+        if sleep:
+            time.sleep(sleep)
         if not_found_selector:
             not_found = self.find_elements_by_css_selector(not_found_selector)
             if not_found_substring in not_found[0].text.strip():
@@ -67,20 +610,42 @@ class Browser(WebDriver):
         return True
 
     @error_handling
-    def get_element(self, selector, attributes=None, multiple=False) -> Union[list, WebElement, None]:
+    def get_element(self, selector, attributes=None, multiple=False, properties=None, text=False, bulk=True,
+                    as_dataframe=False) -> Union[list, WebElement, None, Any]:
         '''
         Function to search for element with built-in error handling
         Returns list of WebElements, single WebElement or list of dictionaries for attributes
+        When attributes, properties or text are requested they are collected for all matching elements
+        in a single execute_script call, bulk=False reads them per element with WebElement.get_attribute
+        Set as_dataframe to get a pandas DataFrame instead of a list of dictionaries
         '''
-        elems = self.find_elements_by_css_selector(selector)
-        if type(attributes) in [list, tuple] and elems:
-            output = []
-            for elem in elems:
-                attributes = {}
-                for attribute in attributes:
-                    attributes[elem] = elem.get_attribute(attribute)
-                output.append(attributes)
+        if attributes is not None and type(attributes) not in [list, tuple]:
+            raise TypeError(f'The attributes parameter must be of type "list" or "tuple", '
+                            f'not type "{type(attributes).__name__}".')
+        if attributes or properties or text:
+            if bulk:
+                output = self.execute_script(BULK_ELEMENT_SCRIPT, {'selector': selector,
+                                                                   'attributes': list(attributes or []),
+                                                                   'properties': list(properties or []),
+                                                                   'text': bool(text)})
+            else:
+                output = []
+                for elem in self.find_elements_by_css_selector(selector):
+                    record = {}
+                    for attribute in attributes or []:
+                        record[attribute] = elem.get_attribute(attribute)
+                    for prop in properties or []:
+                        record[prop] = elem.get_property(prop)
+                    if text:
+                        record['text'] = elem.text
+                    output.append(record)
+            if as_dataframe:
+                import pandas as pd
+                return pd.DataFrame(output, columns=list(attributes or []) + list(properties or []) +
+                                    (['text'] if text else []))
             return output
+
+        elems = self.find_elements_by_css_selector(selector)
         if multiple:
             return elems
         else:
@@ -89,24 +654,121 @@ class Browser(WebDriver):
             except IndexError:
                 return None
 
-    def get_full_page_screenshot(self, name=str(datetime.now().timestamp()), ext='png', width=1920, sep_instance=True):
+    @error_handling
+    def extract(self, schema: Union[Schema, dict]) -> Union[dict, None]:
+        '''
+        Function to extract the fields described by a schema (see schema.Schema) from the current page
+        with a single execute_script call, schema dictionaries are compiled once per session
+        '''
+        compiled = compile_schema(schema, self._schemas)
+        result = self.execute_script(compiled.script)
+        return compiled.finish(result['data'], result['base'])
+
+    def cache_identity(self) -> tuple:
+        '''
+        Function to get the user-agent and viewport of this session, used to key pages in a PageCache
+        '''
+        if self._cache_identity is None:
+            self._cache_identity = tuple(self.execute_script(
+                'return [navigator.userAgent, window.innerWidth + "x" + window.innerHeight];'))
+        return self._cache_identity
+
+    def cached_get(self, url, cache, **safe_get_kwargs) -> Union[bool, None]:
+        '''
+        Function to retrieve url through a page_cache.PageCache
+        A fresh cached copy is replayed into the current tab without touching the network, otherwise
+        the url is retrieved with safe_get() and its page source is stored in the cache
+        '''
+        user_agent, viewport = self.cache_identity()
+        page = cache.get(url, user_agent, viewport)
+        if page is not None:
+            self.replay(page.html, url)
+            return True
+        loaded = self.safe_get(url, **safe_get_kwargs)
+        if loaded:
+            cache.put(url, self.page_source, user_agent, viewport)
+        return loaded
+
+    def replay(self, html, url=None):
+        '''
+        Function to load stored HTML into the current tab through DevTools so it can be queried like a live page
+        Scripts are removed and relative links resolve against url when given
+        '''
+        html = re.sub(r'<script\b[^>]*>.*?</script\s*>', '', html, flags=re.I | re.S)
+        if url:
+            base = f'<base href="{url}">'
+            html, found = re.subn(r'<head\b[^>]*>', lambda m: m.group(0) + base, html, count=1, flags=re.I)
+            if not found:
+                html = base + html
+        frame_id = self.execute_cdp_cmd('Page.getFrameTree', {})['frameTree']['frame']['id']
+        self.execute_cdp_cmd('Page.setDocumentContent', {'frameId': frame_id, 'html': html})
+
+    def capture_full_page(self, name=None, ext='png', quality=None, width=None, folder=DIRNAME_SCREENSHOTS) -> Future:
+        '''
+        Function to create a full page screenshot in the current session with DevTools Page.captureScreenshot,
+        capturing beyond the viewport without resizing the window
+        ext is png, jpg/jpeg or webp, quality (0-100) applies to jpeg and webp, width temporarily
+        overrides the viewport width
+        Decoding and writing the file happen on a background thread, returns a Future with the file path
+        '''
+        if ext not in SCREENSHOT_FORMATS:
+            raise ValueError(f'The ext parameter must be one of {", ".join(SCREENSHOT_FORMATS)}, not "{ext}".')
+        name = name or str(datetime.now().timestamp())
+        params = {'format': SCREENSHOT_FORMATS[ext], 'captureBeyondViewport': True, 'fromSurface': True}
+        if quality is not None and ext != 'png':
+            params['quality'] = quality
+
+        self.switch_to.default_content()
+        if width:
+            self.execute_cdp_cmd('Emulation.setDeviceMetricsOverride',
+                                 {'width': width, 'height': 0, 'deviceScaleFactor': 0, 'mobile': False})
+        try:
+            metrics = self.execute_cdp_cmd('Page.getLayoutMetrics', {})
+            size = metrics.get('cssContentSize') or metrics['contentSize']
+            params['clip'] = {'x': 0, 'y': 0, 'width': size['width'], 'height': size['height'], 'scale': 1}
+            data = self.execute_cdp_cmd('Page.captureScreenshot', params)['data']
+        finally:
+            if width:
+                self.execute_cdp_cmd('Emulation.clearDeviceMetricsOverride', {})
+        return _write_screenshot(data, os.path.join(folder, f'{name}.{ext}'))
+
+    def get_full_page_screenshot(self, name=None, ext='png', width=1920, sep_instance=True,
+                                 pool=None, devtools=True, quality=None) -> Union[Future, None]:
         '''
         Function to create a full page screen shot given a set of parameters and
         saves it in /screenshots in the working directory
-        Defaults to operations in seperate Browser instance
+        Defaults to capture_full_page() in the current session, returning a Future for the background write
+        With devtools=False it defaults to operations in seperate Browser instance
+        When a BrowserPool is passed the seperate instance is borrowed from the pool instead of started
         '''
+        if devtools:
+            return self.capture_full_page(name, ext, quality, width)
+        name = name or str(datetime.now().timestamp())
+
         if not os.path.exists(DIRNAME_SCREENSHOTS):
             os.mkdir(DIRNAME_SCREENSHOTS)
 
         if sep_instance:
-            ss_driver = browser(headless=True, size=(width, 1080))
-            ss_driver.get(self.current_url)
-            time.sleep(2)
-            ss_driver.switch_to.default_content()
-            page_height = self.get_pageheight()
-            ss_driver.set_window_size(width, page_height)
-            ss_driver.save_screenshot(f'{DIRNAME_SCREENSHOTS}\\{name}.{ext}')
-            ss_driver.quit()
+            ss_driver = pool.checkout() if pool else browser(headless=True, size=(width, 1080))
+            driver_size = None
+            try:
+                driver_size = ss_driver.get_window_size()
+                ss_driver.track_network()
+                ss_driver.get(self.current_url)
+                ss_driver.wait_until_ready(network_idle=500)
+                ss_driver.switch_to.default_content()
+                page_height = self.get_pageheight()
+                ss_driver.set_window_size(width, page_height)
+                ss_driver.save_screenshot(f'{DIRNAME_SCREENSHOTS}\\{name}.{ext}')
+            finally:
+                if pool:
+                    try:
+                        if driver_size is not None:
+                            ss_driver.set_window_size(driver_size['width'], driver_size['height'])
+                    finally:
+                        pool.checkin(ss_driver)
+                else:
+                    ss_driver.quit()
 
         else:
             page_height = self.get_pageheight()
@@ -118,10 +780,68 @@ class Browser(WebDriver):
 
     @error_handling
     def scroll_to_bottom(self):
-        self.execute_script(
-            'var pageHeight = document.querySelector("html").getBoundingClientRect["bottom"]; '
-            'window.scrollBy(0, pageHeight);'
-        )
+        self.execute_script('var root = document.scrollingElement || document.documentElement; '
+                            'window.scrollTo(0, root.scrollHeight);')
+
+    def _scroll_steps(self, spec, max_scrolls, idle, stable_rounds, timeout) -> Iterator[dict]:
+        '''
+        Function to run HARVEST_SCRIPT until the page stopped growing for stable_rounds scrolls in a row,
+        max_scrolls scrolls were made or timeout seconds passed, yielding the result of every scroll
+        '''
+        step_timeout = max(idle * 5, 5)
+        spec = dict(spec, idle=idle * 1000, timeout=step_timeout * 1000)
+        deadline = time.monotonic() + timeout
+        stable = 0
+        try:
+            for _ in range(max_scrolls):
+                step = self._execute_async_script(HARVEST_SCRIPT, step_timeout, spec)
+                yield step
+                stable = 0 if step['grew'] or step['records'] else stable + 1
+                if (stable >= stable_rounds and not step['pending']) or time.monotonic() > deadline:
+                    break
+        finally:
+            try:
+                self.execute_script('if (window.__cdHarvest) { window.__cdHarvest.observer.disconnect(); '
+                                    'delete window.__cdHarvest; }')
+            except WebDriverException:
+                pass
+
+    def scroll_until_stable(self, max_scrolls=100, idle=1.0, stable_rounds=2, timeout=60) -> int:
+        '''
+        Function to keep scrolling to the bottom until the page height stops growing, e.g. to load an infinite feed
+        A scroll ends once the DOM was quiet for idle seconds, stable_rounds scrolls without growth end the loop.
+        Returns the final page height
+        '''
+        spec = {'selector': None, 'attributes': [], 'properties': [], 'text': False, 'batch': 1, 'existing': False}
+        height = None
+        for step in self._scroll_steps(spec, max_scrolls, idle, stable_rounds, timeout):
+            height = step['height']
+        return height
+
+    def harvest(self, selector, attributes=None, properties=None, text=False, batch_size=50, max_items=None,
+                max_scrolls=100, idle=1.0, stable_rounds=2, timeout=300, include_existing=True,
+                key=None) -> Iterator[list]:
+        '''
+        Function to scroll an infinite feed and yield the records (see get_element) of elements matching
+        selector in batches of at most batch_size as they are added to the page
+        Only new elements are read, stops like scroll_until_stable() or after max_items records.
+        key names a record field to drop duplicates by, for feeds that re-create elements while scrolling.
+        '''
+        spec = {'selector': selector, 'attributes': list(attributes or []), 'properties': list(properties or []),
+                'text': bool(text), 'batch': batch_size, 'existing': include_existing}
+        seen = set()
+        harvested = 0
+        for step in self._scroll_steps(spec, max_scrolls, idle, stable_rounds, timeout):
+            records = step['records']
+            if key is not None:
+                records = [r for r in records if r.get(key) not in seen and not seen.add(r.get(key))]
+            if max_items is not None:
+                records = records[:max_items - harvested]
+            if records:
+                harvested += len(records)
+                yield records
+            if max_items is not None and harvested >= max_items:
+                break
 
     @error_handling
     def scroll_to_top(self):
@@ -134,13 +854,58 @@ class Browser(WebDriver):
                                    )['bottom']
 
     def open_dev_tools(self):
+        from pynput.keyboard import Key, Controller
+
         keyboard = Controller()
         keyboard.press(Key.f12)
         keyboard.release(Key.f12)
 
     @error_handling
-    def get_datalayer(self) -> dict:
-        return self.execute_script('return dataLayer;')
+    def get_datalayer(self, name='dataLayer') -> Union[list, None]:
+        '''
+        Function to return the current contents of the dataLayer, or None when the page doesn't define it
+        '''
+        return self.execute_script('return window[arguments[0]] === undefined ? null : window[arguments[0]];', name)
+
+    def capture_datalayer(self, name='dataLayer', max_events=10000):
+        '''
+        Function to record every push to the dataLayer, from the start of every following document, with a timestamp
+        and the url of the page. Events are buffered in the page and collected with drain_datalayer(), at most
+        max_events are kept and older ones are dropped (counted in datalayer_dropped). Pass None to stop capturing.
+        '''
+        if self._datalayer_hook is not None:
+            self._drain_page_datalayer()
+            self.execute_cdp_cmd('Page.removeScriptToEvaluateOnNewDocument', {'identifier': self._datalayer_hook})
+            self._datalayer_hook = None
+        if name is None:
+            return
+        if not re.fullmatch(r'[A-Za-z_$][\w$]*', name):
+            raise ValueError(f'"{name}" is not a valid JavaScript variable name.')
+        script = DATALAYER_HOOK_SCRIPT % {'name': name, 'max_events': max_events}
+        self._datalayer_hook = self.execute_cdp_cmd('Page.addScriptToEvaluateOnNewDocument',
+                                                    {'source': script})['identifier']
+        self._datalayer_events = deque(self._datalayer_events, maxlen=max_events)
+        self.execute_script(script)
+
+    def drain_datalayer(self) -> list:
+        '''
+        Function to collect all dataLayer pushes recorded since the last drain, including those of pages
+        navigated away from, as dictionaries with timestamp (ms since epoch), url and event
+        '''
+        self._drain_page_datalayer()
+        events = list(self._datalayer_events)
+        self._datalayer_events.clear()
+        return events
+
+    def _drain_page_datalayer(self):
+        try:
+            drained = self.execute_script(DATALAYER_DRAIN_SCRIPT)
+        except WebDriverException:
+            return
+        if drained:
+            overflow = len(self._datalayer_events) + len(drained['events']) - (self._datalayer_events.maxlen or 0)
+            self.datalayer_dropped += drained['dropped'] + max(overflow, 0)
+            self._datalayer_events.extend(drained['events'])
 
     def get_timed(self, url, print_val=True) -> list:
         '''
@@ -156,11 +921,37 @@ class Browser(WebDriver):
             print(f'Page {url} took {round(stop - start, 2)}s to load.')
         return [url, round(stop - start, 2)]
 
+    def get_navigation_timing(self, timeout=10) -> Union[dict, None]:
+        '''
+        Function to read Navigation and Resource Timing data of the current page
+        Waits at most timeout seconds for the load event to finish, times are in milliseconds
+        from the start of the navigation and sizes in bytes
+        '''
+        timing = self._execute_async_script(NAVIGATION_TIMING_SCRIPT, timeout, timeout * 1000)
+        if timing is not None:
+            timing['url'] = self.current_url
+        return timing
+
+    def clear_cache(self):
+        '''
+        Function to clear the browser cache through DevTools
+        '''
+        self.execute_cdp_cmd('Network.clearBrowserCache', {})
+
+    def run_actions(self, batch: ActionBatch, page_timeout=10) -> list:
+        '''
+        Function to run an actions.ActionBatch of clicks, typing, scrolls and waits in the page,
+        in a single round trip unless steps navigate or target cross-origin iframes
+        Returns a StepResult for every step
+        '''
+        return batch.run(self, page_timeout)
+
     @error_handling
     def click_element(self, selector, iframe=False, iframe_selector='iframe'):
         '''
         Function to click an HTML element by its CSS selector
         When element is inside an iframe specify the iframe element by using the params iframe and iframe_selector
+        For several interactions in a row use run_actions(), which saves the round trips per action
         '''
         try:
             if iframe:
@@ -174,74 +965,248 @@ class Browser(WebDriver):
             warnings.warn('Could not click button, element not found in HTML.', UserWarning)
 
 
-def browser(maximize=False, user_agent=random_ua, headless=False,
-            incognito=False, size=(), disable_scrollbar=False) -> Browser:
+def _write_screenshot(data, path) -> Future:
     '''
-    function to initialize Browser object given a set of ChromeOptions and
-    to make sure ChromeDriver is properly installed and up to date by calling update_chromedriver() if necessary
+    Function to decode a base64 screenshot and write it to path on a shared background thread
     '''
+    global _screenshot_writer
+    if _screenshot_writer is None:
+        _screenshot_writer = ThreadPoolExecutor(max_workers=2, thread_name_prefix='screenshot-writer')
+
+    def write():
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as f:
+            f.write(base64.b64decode(data))
+        return path
+
+    return _screenshot_writer.submit(write)
+
+
+def screenshot_urls(urls, ext='png', quality=None, width=None, folder=DIRNAME_SCREENSHOTS, driver: Browser = None,
+                    workers=1, **safe_get_kwargs) -> dict:
+    '''
+    Function to create full page screenshots of a list of urls with capture_full_page()
+    Files are named after the position and the requested url (not where it redirected to), so they don't collide,
+    and written in the background while the next page loads
+    With workers > 1 the urls are spread over a pool of headless sessions with crawler.crawl()
+    Returns a dictionary of url: file path, or None for urls that could not be captured. Duplicate urls are
+    captured once.
+    '''
+    urls = list(dict.fromkeys(urls))
+    names = {url: f'{index:04d}_' + re.sub(r'[^A-Za-z0-9]+', '_', url).strip('_')[:150]
+             for index, url in enumerate(urls)}
+
+    futures = {}
+    if driver is None or workers > 1:
+        from crawler import crawl
+
+        if driver is not None:
+            warnings.warn('A driver cannot be shared between workers, starting a pool instead.', UserWarning)
+
+        def capture(driver):
+            # Workers don't know which requested url they loaded, files are renamed once they are written
+            return driver.capture_full_page(f'tmp_{uuid.uuid4().hex}', ext, quality, width, folder)
+
+        for result in crawl(urls, workers=workers, extract=capture, **safe_get_kwargs):
+            futures[result.url] = result.data
+    else:
+        for url in urls:
+            futures[url] = None
+            try:
+                if driver.safe_get(url, **safe_get_kwargs):
+                    futures[url] = driver.capture_full_page(names[url], ext, quality, width, folder)
+            except WebDriverException as e:
+                warnings.warn(f'Could not capture {url} because of {e.__class__.__name__} - {e}', UserWarning)
+
+    paths = {}
+    for url, future in futures.items():
+        try:
+            paths[url] = future.result() if future else None
+            if paths[url] is not None:
+                path = os.path.join(folder, f'{names[url]}.{ext}')
+                if paths[url] != path:
+                    os.replace(paths[url], path)
+                    paths[url] = path
+        except OSError as e:
+            warnings.warn(f'Could not write screenshot of {url} because of {e.__class__.__name__} - {e}', UserWarning)
+            paths[url] = None
+    return paths
+
+
+def block_patterns(block) -> list:
+    '''
+    Function to resolve presets, categories and URL patterns to a list of URL patterns for blocking
+    '''
+    if not block:
+        return []
+    if isinstance(block, str):
+        block = [block]
+    patterns = []
+    for name in block:
+        if name in BLOCK_PRESETS:
+            patterns += block_patterns(BLOCK_PRESETS[name])
+        elif name in BLOCK_CATEGORIES:
+            patterns += BLOCK_CATEGORIES[name]
+        elif '*' in name or '.' in name or '/' in name:
+            patterns.append(name)
+        else:
+            raise ValueError(f'Unknown block preset or category "{name}", use one of '
+                             f'{", ".join(list(BLOCK_PRESETS) + list(BLOCK_CATEGORIES))} or a URL pattern.')
+    return list(dict.fromkeys(patterns))
+
+
+def _url_pattern(pattern) -> re.Pattern:
+    '''
+    Function to compile a setBlockedURLs pattern, where only * is a wildcard
+    '''
+    return re.compile('.*'.join(re.escape(part) for part in pattern.split('*')), re.S)
+
+
+def _block_category(url) -> str:
+    global _block_regexes
+    if _block_regexes is None:
+        _block_regexes = {category: [_url_pattern(pattern) for pattern in patterns]
+                          for category, patterns in BLOCK_CATEGORIES.items()}
+    for category, regexes in _block_regexes.items():
+        if any(regex.fullmatch(url) for regex in regexes):
+            return category
+    return 'other'
+
+
+def browser_options(maximize=False, user_agent=random_ua, headless=False,
+                    incognito=False, size=(), disable_scrollbar=False, performance_log=False) -> tuple:
+    '''
+    Function to create the ChromeOptions and desired capabilities used by browser() and async_browser()
+    user_agent can be a user-agent string or a function returning one, e.g. a get_user_agents.UARotator
+    '''
+    if callable(user_agent):
+        user_agent = user_agent()
     options = webdriver.ChromeOptions()
     options.add_argument('--ignore-certificate-errors')
     options.add_argument('--disable-notifications')
     options.add_experimental_option("excludeSwitches", ["enable-automation"])
     options.add_experimental_option('useAutomationExtension', False)
-    d = webdriver.DesiredCapabilities.CHROME
+    d = webdriver.DesiredCapabilities.CHROME.copy()
     d['goog:loggingPrefs'] = {'browser': 'ALL'}
+    if performance_log:
+        d['goog:loggingPrefs']['performance'] = 'ALL'
+        options.add_experimental_option('perfLoggingPrefs', {'enableNetwork': True, 'enablePage': False})
 
-    option_values = ['--start-maximized',
-                     f'user-agent={user_agent}',
-                     '--headless',
-                     'incognito'
-                     ]
     if size:
         if not type(size) in [list, tuple]:
             raise TypeError(f'The size parameter must be of type "list" or "tuple", not type "{type(size).__name__}".')
+        if len(size) != 2:
+            raise ValueError(f'The size parameter must contain a width and a height, not {len(size)} values.')
 
         if maximize:
             warnings.warn(
                 f'Cannot use maximize and size. Browser will not use maximize. Size is set to {size[0]}x{size[1]}')
-        option_values.append(f'--window-size={size[0]},{size[1]}')
+            maximize = False
 
+    option_values = ['--start-maximized',
+                     f'user-agent={user_agent}',
+                     '--headless',
+                     'incognito',
+                     f'--window-size={size[0]},{size[1]}' if size else '',
+                     '--hide-scrollbars'
+                     ]
     for index, value in enumerate([maximize, user_agent, headless, incognito, size, disable_scrollbar]):
         if value:
             options.add_argument(option_values[index])
+    return options, d
 
-    try:
-        return Browser(desired_capabilities=d, options=options)
-    except (SessionNotCreatedException, WebDriverException):
-        update_chromedriver()
 
-        try:
-            return Browser(desired_capabilities=d, options=options)
-        except WebDriverException:
-            raise WebDriverException(
-                "Google Chrome not found in PATH, make sure the Google Chrome browser is installed properly.")
+def browser(maximize=False, user_agent=random_ua, headless=False,
+            incognito=False, size=(), disable_scrollbar=False, block=None, datalayer=False,
+            performance_log=False) -> Browser:
+    '''
+    function to initialize Browser object given a set of ChromeOptions and
+    to make sure ChromeDriver is properly installed for the local Chrome version by calling update_chromedriver()
+    block takes resource blocking presets ('text-only', 'analytics-audit', 'trackers'), categories
+    ('images', 'fonts', 'media', 'stylesheets', 'ads', 'analytics') or URL patterns, see Browser.block_resources()
+    datalayer=True records every dataLayer push from the first navigation on, see Browser.capture_datalayer()
+    performance_log=True enables the DevTools performance log for network records in Browser.drain_logs()
+    user_agent takes a user-agent string or a function returning one, pass a get_user_agents.UARotator for
+    weighted rotation or e.g. lambda: rotator.choice('example.com') for a user-agent that sticks to a domain
+    '''
+    patterns = block_patterns(block)
+    options, d = browser_options(maximize, user_agent, headless, incognito, size, disable_scrollbar,
+                                 performance_log=performance_log or bool(patterns))
+
+    try:
+        driver = Browser(executable_path=update_chromedriver(), desired_capabilities=d, options=options)
+    except SessionNotCreatedException as e:
+        raise WebDriverException(f'Could not start Google Chrome, make sure the Google Chrome browser is installed '
+                                 f'properly and matches the ChromeDriver version.\n{e.msg}')
+    if patterns:
+        driver.block_resources(patterns)
+    if datalayer:
+        driver.capture_datalayer()
+    return driver
 
 
-def update_chromedriver():
+def update_chromedriver(version=None, offline=None, mirror=MIRROR, fallback=False) -> str:
     '''
-    Function to retrieve and unpack the latest stable version of ChromeDriver
+    Function to make sure a ChromeDriver matching the installed Google Chrome is cached and return its path
+    See driver_cache.chromedriver_path()
     '''
-    if os.path.exists("chromedriver.exe"):
-        os.remove("chromedriver.exe")
-        print("Updating ChromeDriver..")
-    chrome_url = requests.get('https://chromedriver.chromium.org/')
-    soup = bs.BeautifulSoup(chrome_url.content, 'lxml')
+    return chromedriver_path(version, offline, mirror, fallback=fallback)
 
-    all_li = soup.find_all('li')
-    for li in all_li:
-        if "Latest stable" in li.text:
-            if platform in ['darwin', 'linux']:
-                op_sys = 'mac64'
-            else:
-                op_sys = 'win32'
-            download_url = f"https://chromedriver.storage.googleapis.com/{li.find('a')['href'].split('?path=')[1]}chromedriver_{op_sys}.zip"
-            file_n = f"{DIRNAME_ORIGIN}\\chromedriver.zip"
-            urllib.request.urlretrieve(download_url, file_n)
-    with ZipFile(file_n, 'r') as zipObj:
-        zipObj.extract('chromedriver.exe')
-    print('ChromeDriver successfully installed')
-    if os.path.exists(file_n):
-        os.remove(file_n)
 
+def benchmark_load(urls, repeats=3, modes=('cold', 'warm'), percentiles=(50, 90, 95), driver: Browser = None,
+                   raw=False, timeout=30):
+    '''
+    Function to benchmark page loads with Navigation and Resource Timing data
+    Every url is loaded repeats times per mode: 'cold' clears the browser cache before each load,
+    'warm' loads the url once to fill the cache and then measures repeats loads from the cache
+    Returns a pandas DataFrame with the given percentiles per url and mode, or every single run with raw=True
+    Uses the given Browser or starts a headless one
+    '''
+    import pandas as pd
+
+    for mode in modes:
+        if mode not in ('cold', 'warm'):
+            raise ValueError(f'Benchmark modes must be "cold" or "warm", not "{mode}".')
+    own_driver = driver is None
+    if own_driver:
+        driver = browser(headless=True)
+    runs = []
+    try:
+        driver.set_page_load_timeout(timeout)
+        for url in urls:
+            for mode in modes:
+                if mode == 'warm':
+                    try:
+                        driver.get(url)
+                    except WebDriverException as e:
+                        warnings.warn(f'Page {url} cannot be opened to warm the cache, skipping warm runs: '
+                                      f'{e.__class__.__name__} - {e}', UserWarning)
+                        continue
+                for run in range(1, repeats + 1):
+                    if mode == 'cold':
+                        driver.clear_cache()
+                    try:
+                        driver.get(url)
+                    except WebDriverException as e:
+                        warnings.warn(f'Page {url} cannot be opened: {e.__class__.__name__} - {e}', UserWarning)
+                        continue
+                    timing = driver.get_navigation_timing(timeout)
+                    if timing is None:
+                        warnings.warn(f'No navigation timing available for {url}', UserWarning)
+                        continue
+                    timing.update({'requested_url': url, 'mode': mode, 'run': run})
+                    runs.append(timing)
+    finally:
+        if own_driver:
+            driver.quit()
 
+    df = pd.DataFrame(runs)
+    if raw or df.empty:
+        return df
+    metrics = [c for c in df.columns if c not in ('url', 'requested_url', 'mode', 'run')]
+    grouped = df.groupby(['requested_url', 'mode'], sort=False)[metrics]
+    stats = pd.concat({f'p{p}': grouped.quantile(p / 100) for p in percentiles}, axis=1)
+    stats.columns = [f'{metric}_{percentile}' for percentile, metric in stats.columns]
+    stats = stats[[f'{metric}_p{p}' for metric in metrics for p in percentiles]]
+    stats.insert(0, 'runs', grouped.size())
+    return stats.reset_index().rename(columns={'requested_url': 'url'})
@@ -0,0 +1,225 @@
+import io
+import json
+import os
+import platform
+import re
+import shutil
+import stat
+import subprocess
+import sys
+import threading
+import time
+import urllib.request
+import warnings
+from contextlib import contextmanager
+from typing import Union
+from zipfile import ZipFile
+
+from selenium.common.exceptions import WebDriverException
+
+DIRNAME_ORIGIN = os.path.dirname(os.path.realpath(__file__))
+DIRNAME_DRIVERS = os.environ.get('CHROMEDRIVER_CACHE', os.path.join(DIRNAME_ORIGIN, 'drivers'))
+# Chrome for Testing index of the latest ChromeDriver per Chrome major version, a mirror must serve the same file
+MIRROR = os.environ.get('CHROMEDRIVER_MIRROR', 'https://googlechromelabs.github.io/chrome-for-testing')
+INDEX_FILE = 'latest-versions-per-milestone-with-downloads.json'
+DRIVER_NAME = 'chromedriver.exe' if sys.platform.startswith('win') else 'chromedriver'
+CHROME_BINARIES = {
+    'linux': ['google-chrome', 'google-chrome-stable', 'chromium', 'chromium-browser'],
+    'darwin': ['/Applications/Google Chrome.app/Contents/MacOS/Google Chrome',
+               '/Applications/Chromium.app/Contents/MacOS/Chromium'],
+}
+
+# Detected Chrome versions and resolved driver paths, per process
+_resolved = {}
+_resolved_lock = threading.Lock()
+
+
+def _offline_default() -> bool:
+    return os.environ.get('CHROMEDRIVER_OFFLINE', '').lower() in ('1', 'true', 'yes')
+
+
+def chrome_version() -> Union[str, None]:
+    '''
+    Function to detect the version of the locally installed Google Chrome (or Chromium), None if it isn't found
+    '''
+    if 'chrome' in _resolved:
+        return _resolved['chrome']
+    version = None
+    if sys.platform.startswith('win'):
+        import winreg
+
+        for root in (winreg.HKEY_CURRENT_USER, winreg.HKEY_LOCAL_MACHINE):
+            try:
+                with winreg.OpenKey(root, r'Software\Google\Chrome\BLBeacon') as key:
+                    version = winreg.QueryValueEx(key, 'version')[0]
+                    break
+            except OSError:
+                pass
+    else:
+        for binary in CHROME_BINARIES['darwin' if sys.platform == 'darwin' else 'linux']:
+            path = shutil.which(binary) or (binary if os.path.isfile(binary) else None)
+            if path is None:
+                continue
+            try:
+                output = subprocess.run([path, '--version'], capture_output=True, text=True, timeout=10).stdout
+            except (OSError, subprocess.SubprocessError):
+                continue
+            match = re.search(r'\d+(\.\d+){3}', output)
+            if match:
+                version = match.group(0)
+                break
+    _resolved['chrome'] = version
+    return version
+
+
+def driver_platform() -> str:
+    '''
+    Function to return the Chrome for Testing platform name of this machine
+    '''
+    if sys.platform.startswith('win'):
+        return 'win64' if sys.maxsize > 2 ** 32 else 'win32'
+    if sys.platform == 'darwin':
+        return 'mac-arm64' if platform.machine() == 'arm64' else 'mac-x64'
+    return 'linux64'
+
+
+@contextmanager
+def _file_lock(path, timeout=300):
+    '''
+    Function to hold an exclusive lock on path across processes, waits at most timeout seconds
+    '''
+    with open(path, 'a+b') as f:
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                if sys.platform.startswith('win'):
+                    import msvcrt
+
+                    f.seek(0)
+                    msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+                else:
+                    import fcntl
+
+                    fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+                break
+            except OSError:
+                if time.monotonic() > deadline:
+                    raise TimeoutError(f'Could not acquire the lock {path} within {timeout}s.')
+                time.sleep(0.1)
+        try:
+            yield
+        finally:
+            if sys.platform.startswith('win'):
+                import msvcrt
+
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+            else:
+                import fcntl
+
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
+def cached_drivers(folder=DIRNAME_DRIVERS) -> dict:
+    '''
+    Function to list the installed drivers as {major version: path}
+    '''
+    drivers = {}
+    if os.path.isdir(folder):
+        for name in os.listdir(folder):
+            path = os.path.join(folder, name, DRIVER_NAME)
+            if name.isdigit() and os.path.isfile(path):
+                drivers[int(name)] = path
+    return drivers
+
+
+def download_url(major, mirror=MIRROR, timeout=30) -> tuple:
+    '''
+    Function to look up the latest ChromeDriver version and its download url for a Chrome major version
+    '''
+    with urllib.request.urlopen(f'{mirror.rstrip("/")}/{INDEX_FILE}', timeout=timeout) as response:
+        milestones = json.load(response)['milestones']
+    try:
+        milestone = milestones[str(major)]
+    except KeyError:
+        raise WebDriverException(f'No ChromeDriver is available for Chrome {major} on {mirror}.')
+    for download in milestone['downloads'].get('chromedriver', []):
+        if download['platform'] == driver_platform():
+            return milestone['version'], download['url']
+    raise WebDriverException(f'No ChromeDriver {milestone["version"]} is available for {driver_platform()}.')
+
+
+def install_chromedriver(major, mirror=MIRROR, folder=DIRNAME_DRIVERS, timeout=30) -> str:
+    '''
+    Function to download ChromeDriver for a Chrome major version into the cache
+    Only one process installs a version at a time, the others wait for the lock and use its result.
+    The driver is unpacked next to its final location and moved in place, so it is never seen half written.
+    '''
+    target_dir = os.path.join(folder, str(major))
+    target = os.path.join(target_dir, DRIVER_NAME)
+    os.makedirs(target_dir, exist_ok=True)
+    with _file_lock(os.path.join(folder, f'.{major}.lock')):
+        if os.path.isfile(target):
+            return target
+        version, url = download_url(major, mirror, timeout)
+        print(f'Installing ChromeDriver {version}..')
+        with urllib.request.urlopen(url, timeout=timeout) as response:
+            archive = ZipFile(io.BytesIO(response.read()))
+        member = next((name for name in archive.namelist() if os.path.basename(name) == DRIVER_NAME), None)
+        if member is None:
+            raise WebDriverException(f'{url} does not contain {DRIVER_NAME}.')
+        tmp_path = f'{target}.{os.getpid()}.tmp'
+        with archive.open(member) as source, open(tmp_path, 'wb') as f:
+            shutil.copyfileobj(source, f)
+        os.chmod(tmp_path, os.stat(tmp_path).st_mode | stat.S_IXUSR | stat.S_IXGRP | stat.S_IXOTH)
+        with open(os.path.join(target_dir, 'VERSION'), 'w') as f:
+            f.write(version)
+        os.replace(tmp_path, target)
+    print('ChromeDriver successfully installed')
+    return target
+
+
+def chromedriver_path(version=None, offline=None, mirror=MIRROR, folder=DIRNAME_DRIVERS, fallback=False) -> str:
+    '''
+    Function to return the path of a ChromeDriver matching the local Chrome, installing it when needed
+    version overrides the detected Chrome version (a major version is enough). Offline (by default the
+    CHROMEDRIVER_OFFLINE environment variable) never downloads. When no driver for the Chrome major is cached
+    offline, a WebDriverException names both versions, unless fallback is set: then the newest cached driver
+    (or a chromedriver on PATH) is used with a warning. Resolved paths are remembered per process.
+    '''
+    offline = _offline_default() if offline is None else offline
+    version = version or chrome_version()
+    major = int(str(version).split('.')[0]) if version else None
+    key = (major, offline, mirror, folder, fallback)
+    with _resolved_lock:
+        path = _resolved.get(key)
+        if path is not None and os.path.isfile(path):
+            return path
+        drivers = cached_drivers(folder)
+        if major in drivers:
+            path = drivers[major]
+        elif major is not None and not offline:
+            path = install_chromedriver(major, mirror, folder)
+        elif major is not None and not fallback:
+            raise WebDriverException(f'ChromeDriver for Chrome {major} is not cached and offline mode is on, cached '
+                                     f'drivers are for Chrome {", ".join(map(str, sorted(drivers))) or "none"}. '
+                                     f'Pass fallback=True to use one of them anyway.')
+        elif drivers:
+            if major is not None:
+                warnings.warn(f'ChromeDriver for Chrome {major} is not cached, using the driver for Chrome '
+                              f'{max(drivers)} instead.', UserWarning)
+            path = drivers[max(drivers)]
+        else:
+            path = shutil.which('chromedriver')
+            for name in ('chromedriver', 'chromedriver.exe'):
+                if path is None and os.path.isfile(os.path.join(DIRNAME_ORIGIN, name)):
+                    path = os.path.join(DIRNAME_ORIGIN, name)
+            if path is not None and major is not None:
+                warnings.warn(f'ChromeDriver for Chrome {major} is not cached, using {path} of unknown version '
+                              f'instead.', UserWarning)
+        if path is None:
+            raise WebDriverException('ChromeDriver not found: Google Chrome could not be detected and no driver '
+                                     'is cached or on PATH.' if major is None else
+                                     f'ChromeDriver for Chrome {major} is not cached and offline mode is on.')
+        _resolved[key] = path
+        return path
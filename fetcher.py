@@ -0,0 +1,166 @@
+import re
+import threading
+import time
+import warnings
+from typing import NamedTuple, Union
+from urllib.parse import urlsplit
+
+import bs4 as bs
+import requests
+from requests.adapters import HTTPAdapter
+from selenium.common.exceptions import WebDriverException
+
+from browser_pool import BrowserPool
+from get_user_agents import random_ua
+from page_cache import PageCache
+from schema import Schema, compile_schema
+
+# Markup of empty single-page-app mount points and "enable JavaScript" notices
+JS_MARKERS = re.compile(r'<div[^>]+id=["\'](root|app|__next|__nuxt)["\'][^>]*>\s*</div>|'
+                        r'<noscript>[^<]*(enable|requires?)[^<]*javascript', re.I)
+
+
+class FetchResult(NamedTuple):
+    url: str
+    html: Union[str, None]
+    status: Union[int, None]
+    rendered: bool
+    elapsed: float
+
+
+class Fetcher:
+    '''
+    Fetches pages over a pooled keep-alive requests.Session and only falls back to a Browser from a BrowserPool
+    when the content turns out to be rendered by JavaScript.
+    The decision is made once per domain and cached: the first static page marks a domain static and later urls
+    skip the check, js_threshold consecutive JavaScript pages mark it for the browser. js_domains and
+    static_domains preset the decision. Responses that aren't 2xx are returned as they are.
+    One user-agent (by default from random_ua) is used for both HTTP requests and browser sessions.
+    With a PageCache fresh pages are served from disk and stale pages are revalidated with ETag/Last-Modified.
+    '''
+    def __init__(self, user_agent=random_ua, pool: BrowserPool = None, browser_workers=2, connections=10, timeout=30,
+                 required_selector=None, min_text=200, js_domains=(), static_domains=(), cache: PageCache = None,
+                 js_threshold=3):
+        self.user_agent = user_agent() if callable(user_agent) else user_agent
+        self.timeout = timeout
+        self.required_selector = required_selector
+        self.min_text = min_text
+        self.browser_workers = browser_workers
+        self.decisions = {domain: True for domain in js_domains}
+        self.static_domains = set(static_domains)
+        self.js_threshold = js_threshold
+        self._js_counts = {}
+        self.session = requests.Session()
+        self.session.headers['User-Agent'] = self.user_agent
+        adapter = HTTPAdapter(pool_connections=connections, pool_maxsize=connections, max_retries=2)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self.cache = cache
+        self._pool = pool
+        self._own_pool = pool is None
+        self._lock = threading.Lock()
+        self._schemas = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    @property
+    def pool(self) -> BrowserPool:
+        with self._lock:
+            if self._pool is None:
+                self._pool = BrowserPool(size=self.browser_workers, headless=True, user_agent=self.user_agent,
+                                         warm=False)
+            return self._pool
+
+    def needs_browser(self, html, required_selector=None) -> bool:
+        '''
+        Function to decide whether static HTML lacks content that JavaScript would render
+        With a required_selector the element must be present, otherwise the page must contain
+        at least min_text characters of visible text and no empty app mount point
+        '''
+        if JS_MARKERS.search(html):
+            return True
+        soup = bs.BeautifulSoup(html, 'lxml')
+        if required_selector:
+            return soup.select_one(required_selector) is None
+        for tag in soup(['script', 'style', 'noscript', 'template']):
+            tag.decompose()
+        body = soup.body or soup
+        return len(' '.join(body.get_text(' ').split())) < self.min_text
+
+    def fetch(self, url, required_selector=None, **safe_get_kwargs) -> FetchResult:
+        '''
+        Function to retrieve the HTML of url, over HTTP when possible and with a browser when needed
+        Remaining kwargs are passed to Browser.safe_get for browser fetches
+        '''
+        start = time.monotonic()
+        required_selector = required_selector or self.required_selector
+        domain = urlsplit(url).netloc.lower()
+        cached = self.cache.get(url, self.user_agent, allow_stale=True) if self.cache is not None else None
+        if cached is not None and cached.fresh:
+            return FetchResult(url, cached.html, cached.status, False, time.monotonic() - start)
+
+        if not self.decisions.get(domain, False):
+            try:
+                response = self.session.get(url, timeout=self.timeout, headers=PageCache.conditional_headers(cached))
+            except requests.RequestException as e:
+                warnings.warn(f'Could not retrieve {url} over HTTP because of {e.__class__.__name__} - {e}',
+                              UserWarning)
+            else:
+                if response.status_code == 304 and cached is not None:
+                    self.cache.refresh(url, self.user_agent)
+                    return FetchResult(url, cached.html, cached.status, False, time.monotonic() - start)
+                if not response.ok:
+                    return FetchResult(response.url, response.text, response.status_code, False,
+                                       time.monotonic() - start)
+                is_html = 'html' in response.headers.get('Content-Type', 'text/html')
+                if (not is_html or domain in self.static_domains or self.decisions.get(domain) is False
+                        or not self.needs_browser(response.text, required_selector)):
+                    self.decisions.setdefault(domain, False)
+                    if self.cache is not None:
+                        self.cache.put(url, response.text, self.user_agent, status=response.status_code,
+                                       etag=response.headers.get('ETag'),
+                                       last_modified=response.headers.get('Last-Modified'))
+                    return FetchResult(response.url, response.text, response.status_code, False,
+                                       time.monotonic() - start)
+                self._js_counts[domain] = self._js_counts.get(domain, 0) + 1
+                if self._js_counts[domain] >= self.js_threshold:
+                    self.decisions[domain] = True
+
+        try:
+            with self.pool.session() as driver:
+                loaded = driver.safe_get(url, selector=required_selector, **safe_get_kwargs)
+                html = driver.page_source if loaded else None
+                final_url = driver.current_url
+        except WebDriverException as e:
+            warnings.warn(f'Could not retrieve {url} in a browser because of {e.__class__.__name__} - {e}',
+                          UserWarning)
+            return FetchResult(url, None, None, True, time.monotonic() - start)
+        if html and self.cache is not None:
+            self.cache.put(url, html, self.user_agent, status=None)
+        # WebDriver doesn't expose the status code of the document
+        return FetchResult(final_url, html, None, True, time.monotonic() - start)
+
+    def fetch_tables(self, url, **kwargs) -> dict:
+        '''
+        Function to fetch url and convert all its tables with html_table_parse.all_tables()
+        '''
+        from html_table_parse import all_tables
+
+        result = self.fetch(url)
+        return all_tables(result.html, **kwargs) if result.html else {}
+
+    def extract(self, url, schema: Union[Schema, dict], **kwargs) -> Union[dict, None]:
+        '''
+        Function to fetch url and extract the fields of a schema (see schema.Schema) from its HTML
+        '''
+        result = self.fetch(url, **kwargs)
+        return compile_schema(schema, self._schemas).from_html(result.html, result.url) if result.html else None
+
+    def close(self):
+        self.session.close()
+        if self._own_pool and self._pool is not None:
+            self._pool.close()
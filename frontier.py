@@ -0,0 +1,275 @@
+import json
+import os
+import posixpath
+import random
+import re
+import sqlite3
+import string
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Iterable, NamedTuple, Union
+from urllib.parse import parse_qsl, quote, urlencode, urlsplit, urlunsplit
+
+DIRNAME_ORIGIN = os.path.dirname(os.path.realpath(__file__))
+
+# Query parameters that only track where a visitor came from and never change the page
+TRACKING_PARAMS = ('utm_source', 'utm_medium', 'utm_campaign', 'utm_term', 'utm_content', 'gclid', 'fbclid',
+                   'msclkid', 'mc_cid', 'mc_eid', '_ga')
+DEFAULT_PORTS = {'http': 80, 'https': 443}
+UNRESERVED = frozenset(string.ascii_letters + string.digits + '-._~')
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS urls (
+    id INTEGER PRIMARY KEY,
+    url TEXT NOT NULL UNIQUE,
+    domain TEXT NOT NULL,
+    priority INTEGER NOT NULL DEFAULT 0,
+    state TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    not_before REAL NOT NULL DEFAULT 0,
+    lease TEXT,
+    lease_expires REAL,
+    error TEXT,
+    added REAL NOT NULL,
+    finished REAL
+);
+CREATE INDEX IF NOT EXISTS idx_urls_ready ON urls (state, priority DESC, id);
+CREATE INDEX IF NOT EXISTS idx_urls_domain ON urls (state, domain);
+CREATE TABLE IF NOT EXISTS domains (
+    domain TEXT PRIMARY KEY,
+    delay REAL,
+    max_active INTEGER,
+    next_allowed REAL NOT NULL DEFAULT 0
+);
+'''
+
+
+class FrontierItem(NamedTuple):
+    id: int
+    url: str
+    domain: str
+    priority: int
+    attempts: int
+    lease: str
+
+
+def _normalize_encoding(component, safe) -> str:
+    '''
+    Function to normalize percent-encoding as in RFC 3986: escapes of unreserved characters are decoded,
+    other escapes (like %2F) are kept with uppercase hex and characters that need escaping are escaped
+    '''
+    def decode(match):
+        char = chr(int(match.group(1), 16))
+        return char if char in UNRESERVED else '%' + match.group(1).upper()
+
+    return quote(re.sub(r'%([0-9A-Fa-f]{2})', decode, component), safe=safe + '%')
+
+
+def normalize_url(url) -> str:
+    '''
+    Function to normalize a url so that equivalent urls are stored once
+    Lowercases scheme and host, drops default ports, fragments and tracking parameters,
+    resolves dot segments and sorts the query string
+    '''
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or '').rstrip('.')
+    netloc = f'[{host}]' if ':' in host else host
+    if parts.port and parts.port != DEFAULT_PORTS.get(scheme):
+        netloc += f':{parts.port}'
+    if parts.username:
+        netloc = f'{parts.username}{":" + parts.password if parts.password else ""}@{netloc}'
+    path = posixpath.normpath(parts.path) if parts.path else '/'
+    if path.startswith('//'):
+        path = '/' + path.lstrip('/')
+    if parts.path.endswith('/') and path != '/':
+        path += '/'
+    path = _normalize_encoding(path, safe='/:@!$&\'()*+,;=')
+    query = urlencode(sorted((key, value) for key, value in parse_qsl(parts.query, keep_blank_values=True)
+                             if key not in TRACKING_PARAMS))
+    return urlunsplit((scheme, netloc, path, query, ''))
+
+
+class Frontier:
+    '''
+    Persistent crawl queue in SQLite that several threads and processes can claim urls from
+    Urls are normalized and stored once, claimed highest priority first and leased for lease_time seconds:
+    a worker that dies without completing its urls only delays them until the lease expires.
+    Per domain at most max_per_domain urls are leased at a time and claims are spaced delay seconds apart,
+    both can be overridden per domain with set_domain(). Failed urls are retried after an exponential backoff
+    until max_attempts is reached.
+    '''
+    def __init__(self, path=f'{DIRNAME_ORIGIN}/frontier.db', delay=1.0, max_per_domain=2, max_attempts=3,
+                 backoff=30.0, lease_time=300.0):
+        self.path = path
+        self.delay = delay
+        self.max_per_domain = max_per_domain
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.lease_time = lease_time
+        with self._connect() as conn:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.executescript(SCHEMA)
+
+    @contextmanager
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.path, timeout=60, isolation_level=None)
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    @contextmanager
+    def _transaction(self) -> sqlite3.Connection:
+        '''
+        Function to run statements in a transaction that holds the write lock from the start,
+        so that concurrent claims never see the same url as available
+        '''
+        with self._connect() as conn:
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                yield conn
+            except BaseException:
+                conn.execute('ROLLBACK')
+                raise
+            conn.execute('COMMIT')
+
+    def add(self, url, priority=0) -> bool:
+        '''
+        Function to add a url, returns False when it was already in the frontier
+        '''
+        return self.add_many([url], priority) == 1
+
+    def add_many(self, urls: Iterable[str], priority=0) -> int:
+        '''
+        Function to add urls in one transaction, returns the number of urls that were new
+        '''
+        now = time.time()
+        rows = []
+        for url in urls:
+            url = normalize_url(url)
+            rows.append((url, urlsplit(url).hostname or '', priority, now))
+        with self._transaction() as conn:
+            before = conn.total_changes
+            conn.executemany('INSERT OR IGNORE INTO urls (url, domain, priority, added) VALUES (?, ?, ?, ?)', rows)
+            return conn.total_changes - before
+
+    def set_domain(self, domain, delay=None, max_active=None):
+        '''
+        Function to override the delay between claims and the number of concurrent leases for a domain
+        '''
+        with self._transaction() as conn:
+            conn.execute('INSERT INTO domains (domain, delay, max_active) VALUES (?, ?, ?) '
+                         'ON CONFLICT (domain) DO UPDATE SET delay = excluded.delay, max_active = excluded.max_active',
+                         (domain.lower(), delay, max_active))
+
+    def _expire_leases(self, conn, now):
+        conn.execute("UPDATE urls SET state = 'failed', lease = NULL, error = 'lease expired', finished = ? "
+                     "WHERE state = 'leased' AND lease_expires < ? AND attempts >= ?", (now, now, self.max_attempts))
+        conn.execute("UPDATE urls SET state = 'pending', lease = NULL "
+                     "WHERE state = 'leased' AND lease_expires < ?", (now,))
+
+    def _blocked_domains(self, conn, now) -> list:
+        '''
+        Function to list the domains that can't be claimed now, because of their delay or concurrency cap
+        '''
+        blocked = {row[0] for row in conn.execute('SELECT domain FROM domains WHERE next_allowed > ?', (now,))}
+        blocked.update(row[0] for row in conn.execute(
+            "SELECT u.domain FROM urls u LEFT JOIN domains d ON d.domain = u.domain WHERE u.state = 'leased' "
+            "GROUP BY u.domain HAVING COUNT(*) >= COALESCE(MAX(d.max_active), ?)", (self.max_per_domain,)))
+        return list(blocked)
+
+    def claim(self, timeout=0) -> Union[FrontierItem, None]:
+        '''
+        Function to lease the next url that may be visited now
+        Waits at most timeout seconds (None waits as long as urls are pending or leased),
+        returns None when nothing can be claimed in that time
+        '''
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            now = time.time()
+            with self._transaction() as conn:
+                self._expire_leases(conn, now)
+                row = conn.execute("SELECT id, url, domain, priority, attempts FROM urls "
+                                   "WHERE state = 'pending' AND not_before <= ? "
+                                   "AND domain NOT IN (SELECT value FROM json_each(?)) "
+                                   "ORDER BY priority DESC, id LIMIT 1",
+                                   (now, json.dumps(self._blocked_domains(conn, now)))).fetchone()
+                if row is not None:
+                    lease = uuid.uuid4().hex
+                    conn.execute("UPDATE urls SET state = 'leased', lease = ?, lease_expires = ?, "
+                                 "attempts = attempts + 1 WHERE id = ?", (lease, now + self.lease_time, row[0]))
+                    conn.execute('INSERT INTO domains (domain, next_allowed) VALUES (?, ?) ON CONFLICT (domain) '
+                                 'DO UPDATE SET next_allowed = ? + COALESCE(delay, ?)',
+                                 (row[2], now + self.delay, now, self.delay))
+                    return FrontierItem(row[0], row[1], row[2], row[3], row[4] + 1, lease)
+                active = conn.execute("SELECT COUNT(*) FROM urls WHERE state IN ('pending', 'leased')").fetchone()[0]
+            if not active or (deadline is not None and time.monotonic() >= deadline):
+                return None
+            time.sleep(0.05 if deadline is None else max(min(0.05, deadline - time.monotonic()), 0))
+
+    def _finish(self, item: FrontierItem, state, error=None, not_before=0.0) -> bool:
+        with self._transaction() as conn:
+            cursor = conn.execute('UPDATE urls SET state = ?, lease = NULL, error = ?, not_before = ?, finished = ? '
+                                  'WHERE id = ? AND lease = ?',
+                                  (state, error, not_before, time.time() if state in ('done', 'failed') else None,
+                                   item.id, item.lease))
+            return cursor.rowcount == 1
+
+    def complete(self, item: FrontierItem) -> bool:
+        '''
+        Function to mark a claimed url as done, returns False when its lease expired and it was claimed again
+        '''
+        return self._finish(item, 'done')
+
+    def fail(self, item: FrontierItem, error=None, retry=True) -> bool:
+        '''
+        Function to report a failed visit, the url is retried after backoff * 2 ** (attempts - 1) seconds
+        (with jitter) until max_attempts is reached
+        '''
+        if not retry or item.attempts >= self.max_attempts:
+            return self._finish(item, 'failed', error)
+        wait = self.backoff * 2 ** (item.attempts - 1) * random.uniform(0.75, 1.25)
+        return self._finish(item, 'pending', error, time.time() + wait)
+
+    def release(self, item: FrontierItem) -> bool:
+        '''
+        Function to give a claimed url back without counting the attempt, e.g. on shutdown
+        '''
+        with self._transaction() as conn:
+            cursor = conn.execute("UPDATE urls SET state = 'pending', lease = NULL, attempts = attempts - 1 "
+                                  "WHERE id = ? AND lease = ?", (item.id, item.lease))
+            return cursor.rowcount == 1
+
+    def renew(self, item: FrontierItem) -> bool:
+        '''
+        Function to extend the lease of a url that takes longer than lease_time
+        '''
+        with self._transaction() as conn:
+            cursor = conn.execute('UPDATE urls SET lease_expires = ? WHERE id = ? AND lease = ?',
+                                  (time.time() + self.lease_time, item.id, item.lease))
+            return cursor.rowcount == 1
+
+    def retry_failed(self) -> int:
+        '''
+        Function to queue all failed urls again with their attempts reset
+        '''
+        with self._transaction() as conn:
+            return conn.execute("UPDATE urls SET state = 'pending', attempts = 0, not_before = 0, error = NULL "
+                                "WHERE state = 'failed'").rowcount
+
+    def stats(self) -> dict:
+        '''
+        Function to count the urls per state
+        '''
+        with self._connect() as conn:
+            counts = dict(conn.execute('SELECT state, COUNT(*) FROM urls GROUP BY state').fetchall())
+        return {state: counts.get(state, 0) for state in ('pending', 'leased', 'done', 'failed')}
+
+    def __len__(self) -> int:
+        '''
+        Number of urls that still have to be visited
+        '''
+        stats = self.stats()
+        return stats['pending'] + stats['leased']
@@ -2,11 +2,7 @@ import pathlib
 import random
 import sqlite3
 import time
-import urllib.request
 import warnings
-import pandas as pd
-import requests
-import bs4 as bs
 import os
 from functools import lru_cache
 from typing import Union, Any
@@ -16,8 +12,6 @@ from selenium.common.exceptions import SessionNotCreatedException, WebDriverExce
     UnexpectedAlertPresentException, NoSuchElementException, InvalidSelectorException, InvalidArgumentException
 from selenium.webdriver.remote.webelement import WebElement
 from sys import platform
-from zipfile import ZipFile
-from pynput.keyboard import Key, Controller
 from datetime import datetime, timedelta
 
 
@@ -34,6 +28,8 @@ def check_db(filters) -> list:
 
     Returns a (filtered - when specified) list of user_agents, possibly cached to maximize speed.
     '''
+    import pandas as pd
+
     today = datetime.now()
     db_name = get_db()
     if db_name:
@@ -72,11 +68,15 @@ def get_db() -> Union[str, None]:
         return dbs[0]
 
 
-def collect_agents() -> pd.DataFrame:
+def collect_agents():
     '''
     Function to retrieve the latest user-agents for all different devices and operating systems and
     to create a database to store the results.
     '''
+    import bs4 as bs
+    import pandas as pd
+    import requests
+
     url = 'https://deviceatlas.com/blog/list-of-user-agent-strings'
 
     r = requests.get(url)
@@ -116,6 +116,8 @@ def list_devices(filter_=None) -> Union[list, None]:
     '''
     Function to list devices that are currently in an existing database
     '''
+    import pandas as pd
+
     db = get_db()
 
     if db:
@@ -243,6 +245,8 @@ class Browser(WebDriver):
                                    )['bottom']
 
     def open_dev_tools(self):
+        from pynput.keyboard import Key, Controller
+
         keyboard = Controller()
         keyboard.press(Key.f12)
         keyboard.release(Key.f12)
@@ -331,6 +335,11 @@ def update_chromedriver():
     '''
     Function to retrieve and unpack the latest stable version of ChromeDriver
     '''
+    import urllib.request
+    from zipfile import ZipFile
+    import bs4 as bs
+    import requests
+
     if os.path.exists("chromedriver.exe"):
         os.remove("chromedriver.exe")
         print("Updating ChromeDriver..")
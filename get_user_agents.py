@@ -1,50 +1,183 @@
-from functools import lru_cache
 import pathlib
+import re
 from typing import Union
 
-import bs4 as bs
 import os
-import pandas as pd
 import sqlite3
+import threading
+import time
+from collections import OrderedDict
 from datetime import datetime, timedelta
-import requests
 import random
+from urllib.parse import urlsplit
 
 DIRNAME = str(pathlib.Path().resolve())
+MAX_DB_AGE = timedelta(days=30)
+# Seconds a UARotator uses its sampling tables before checking whether the database changed
+TABLE_CHECK_INTERVAL = 60
 
+OS_FAMILIES = [('Windows Phone', r'Windows Phone'), ('Windows', r'Windows'), ('Android', r'Android'),
+               ('iOS', r'iPhone|iPad|iPod'), ('Chrome OS', r'CrOS'), ('macOS', r'Mac OS X|Macintosh'),
+               ('Linux', r'Linux|X11')]
+BROWSER_FAMILIES = [('Edge', r'Edg(e|A|iOS)?/'), ('Opera', r'OPR/|Opera'), ('Samsung Internet', r'SamsungBrowser'),
+                    ('Firefox', r'Firefox|FxiOS'), ('Chrome', r'Chrome|CriOS'), ('Internet Explorer', r'MSIE|Trident'),
+                    ('Safari', r'Safari')]
 
-@lru_cache
-def check_db(filters) -> list:
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS user_agents (
+    id INTEGER PRIMARY KEY,
+    device TEXT NOT NULL COLLATE NOCASE,
+    os TEXT NOT NULL COLLATE NOCASE,
+    browser TEXT NOT NULL COLLATE NOCASE,
+    ua_string TEXT NOT NULL UNIQUE
+);
+CREATE INDEX IF NOT EXISTS idx_user_agents_device ON user_agents (device);
+CREATE INDEX IF NOT EXISTS idx_user_agents_os ON user_agents (os, browser);
+CREATE INDEX IF NOT EXISTS idx_user_agents_browser ON user_agents (browser);
+'''
+FTS_SCHEMA = '''
+CREATE VIRTUAL TABLE IF NOT EXISTS user_agents_fts USING fts5(device, content='user_agents', content_rowid='id');
+INSERT INTO user_agents_fts(user_agents_fts) VALUES ('rebuild');
+'''
+
+# Lookups are cached per database file and invalidated when the file is replaced or modified
+_cache = {}
+_cache_key = None
+
+
+def family(ua_string, families) -> str:
+    '''
+    Function to classify a user-agent string into the first matching family, e.g. of OS_FAMILIES
+    '''
+    for name, pattern in families:
+        if re.search(pattern, ua_string):
+            return name
+    return 'Other'
+
+
+def check_db(filters=None, os_filter=None, browser_filter=None, match='contains') -> tuple:
     '''
     Function to retrieve user-agents from an existing database.
     Will create a new database if there is none, or if existing data is older than 30 days
+    Filters apply to device, operating system family and browser family, match is one of
+    'contains' (substring), 'prefix' (uses the indexes) or 'fts' (full-text search for all words on device,
+    a trailing * matches word prefixes)
 
-    Returns a (filtered - when specified) list of user_agents, possibly cached to maximize speed.
+    Returns a (filtered - when specified) tuple of user_agents, cached until the database changes.
     '''
-    today = datetime.now()
-    db_name = get_db()
-    if db_name:
-        last_date = datetime.strptime(db_name.split('-')[0], '%Y%m%d')
-        if last_date > today - timedelta(days=30):
-            conn = sqlite3.connect(db_name)
+    global _cache_key
+    db_name, stat = _current_db()
+    key = (db_name, stat.st_mtime_ns, stat.st_size)
+    if key != _cache_key:
+        _cache.clear()
+        _cache_key = key
+    lookup = (filters, os_filter, browser_filter, match)
+    try:
+        return _cache[lookup]
+    except KeyError:
+        pass
 
-            query = 'SELECT * FROM user_agents'
+    conn = sqlite3.connect(db_name)
+    try:
+        _ensure_schema(conn)
+        query, params = _filter_query('SELECT ua_string FROM user_agents', filters, os_filter, browser_filter,
+                                      match, conn)
+        agents = tuple(row[0] for row in conn.execute(query + ' ORDER BY id', params))
+    finally:
+        conn.close()
+    _cache[lookup] = agents
+    return agents
 
-            df = pd.read_sql(query, con=conn)
-            conn.close()
-            if filters:
-                df = df[df.device.str.contains(filters)]
-            agents = df['ua_string'].unique().tolist()
-            return agents
 
+def _current_db() -> tuple:
+    '''
+    Function to find the database in use and its os.stat result, refreshing it when it is too old
+    The last used database is checked first so lookups don't need to list the directory
+    '''
+    db_name = _cache_key[0] if _cache_key else None
+    for _ in range(2):
+        if db_name and _db_date(db_name) > datetime.now() - MAX_DB_AGE:
+            try:
+                return db_name, os.stat(db_name)
+            except FileNotFoundError:
+                pass
+        db_name = get_db()
     print('Fetching most recent user agents')
-    df = collect_agents()
-    if filters:
-        agents = df[df.device.str.contains(filters)]['ua_string'].unique().tolist()
-    else:
-        agents = df['ua_string'].unique().tolist()
+    collect_agents()
+    db_name = get_db()
+    return db_name, os.stat(db_name)
 
-    return agents
+
+def _db_date(db_name) -> datetime:
+    return datetime.strptime(os.path.basename(db_name).split('-')[0], '%Y%m%d')
+
+
+def _like_pattern(value, match) -> str:
+    value = value.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+    return f'{value}%' if match == 'prefix' else f'%{value}%'
+
+
+def _fts_query(value) -> str:
+    '''
+    Function to quote every word of a filter as an FTS5 string, so characters like - are not read as syntax
+    '''
+    terms = []
+    for term in value.split():
+        prefix = term.endswith('*') and len(term) > 1
+        term = term[:-1] if prefix else term
+        terms.append('"' + term.replace('"', '""') + '"' + ('*' if prefix else ''))
+    return ' '.join(terms)
+
+
+def _filter_query(query, device, os_filter, browser_filter, match, conn) -> tuple:
+    '''
+    Function to add parameterized WHERE clauses for the given filters to a query
+    '''
+    if match not in ('contains', 'prefix', 'fts'):
+        raise ValueError(f'The match parameter must be "contains", "prefix" or "fts", not "{match}".')
+    clauses, params = [], []
+    if device and match == 'fts' and _has_fts(conn):
+        clauses.append('id IN (SELECT rowid FROM user_agents_fts WHERE user_agents_fts MATCH ?)')
+        params.append(_fts_query(device))
+    elif device:
+        clauses.append("device LIKE ? ESCAPE '\\'")
+        params.append(_like_pattern(device, match))
+    for column, value in (('os', os_filter), ('browser', browser_filter)):
+        if value:
+            clauses.append(f"{column} LIKE ? ESCAPE '\\'")
+            params.append(_like_pattern(value, 'prefix' if match == 'prefix' else 'contains'))
+    if clauses:
+        query += ' WHERE ' + ' AND '.join(clauses)
+    return query, params
+
+
+def _has_fts(conn) -> bool:
+    return conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'user_agents_fts'").fetchone() is not None
+
+
+def _ensure_schema(conn):
+    '''
+    Function to migrate databases written by earlier versions (a plain pandas table) to the indexed schema
+    '''
+    columns = [row[1] for row in conn.execute('PRAGMA table_info(user_agents)')]
+    if columns and 'os' not in columns:
+        rows = conn.execute('SELECT device, ua_string FROM user_agents').fetchall()
+        with conn:
+            conn.execute('DROP TABLE user_agents')
+            _write_agents(conn, rows)
+
+
+def _write_agents(conn, rows):
+    '''
+    Function to (re)create the user_agents tables and indexes and insert (device, ua_string) rows
+    '''
+    conn.executescript(SCHEMA)
+    conn.executemany('INSERT OR IGNORE INTO user_agents (device, os, browser, ua_string) VALUES (?, ?, ?, ?)',
+                     [(device, family(ua, OS_FAMILIES), family(ua, BROWSER_FAMILIES), ua) for device, ua in rows])
+    try:
+        conn.executescript(FTS_SCHEMA)
+    except sqlite3.OperationalError:
+        pass
 
 
 def get_db():
@@ -52,11 +185,11 @@ def get_db():
     Function to retrieve existing databases
     '''
     files = os.listdir(DIRNAME)
-    dbs = [f for f in files if 'db_user_agents' in f]
+    dbs = [f for f in files if f.endswith('db_user_agents.db')]
     if len(dbs) == 0:
         return None
     else:
-        return dbs[0]
+        return os.path.join(DIRNAME, sorted(dbs)[-1])
 
 
 def collect_agents():
@@ -64,6 +197,10 @@ def collect_agents():
     Function to retrieve the latest user-agents for all different devices and operating systems and
     to create a database to store the results.
     '''
+    import bs4 as bs
+    import pandas as pd
+    import requests
+
     url = 'https://deviceatlas.com/blog/list-of-user-agent-strings'
 
     r = requests.get(url)
@@ -77,29 +214,36 @@ def collect_agents():
     df = pd.DataFrame(results)
 
     today = datetime.strftime(datetime.now(), '%Y%m%d')
-    dbs = [f for f in os.listdir(DIRNAME) if 'db_user_agents' in f]
-    for x in dbs:
-        os.remove(DIRNAME + '\\' + x)
-
-    conn = sqlite3.connect(DIRNAME + '\\' + today + '-db_user_agents.db')
-    df.to_sql('user_agents', con=conn, if_exists='replace')
+    db_name = os.path.join(DIRNAME, today + '-db_user_agents.db')
+    tmp_name = db_name + '.tmp'
+    if os.path.exists(tmp_name):
+        os.remove(tmp_name)
+    conn = sqlite3.connect(tmp_name)
+    with conn:
+        _write_agents(conn, [(row['device'], row['ua_string']) for row in results])
     conn.close()
 
+    dbs = [f for f in os.listdir(DIRNAME) if f.endswith('db_user_agents.db')]
+    for x in dbs:
+        os.remove(os.path.join(DIRNAME, x))
+    os.replace(tmp_name, db_name)
+
     return df
 
 
-def random_ua(device_filter=None, amount=1) -> Union[str, list]:
+def random_ua(device_filter=None, amount=1, os_filter=None, browser_filter=None, match='contains') \
+        -> Union[str, list]:
     '''
     Function to return a random user-agent or a list of random user-agents.
-    Possibility to filter for a specific device or operating system.
+    Possibility to filter for a specific device, operating system family or browser family.
     '''
-    agents = check_db(device_filter)
+    agents = check_db(device_filter, os_filter, browser_filter, match)
     if amount == 1:
         return random.choice(agents)
     return random.choices(agents, k=amount)
 
 
-def list_devices(filter_=None) -> Union[list, None]:
+def list_devices(filter_=None, match='contains') -> Union[list, None]:
     '''
     Function to list devices that are currently in an existing database
     '''
@@ -107,10 +251,128 @@ def list_devices(filter_=None) -> Union[list, None]:
 
     if db:
         conn = sqlite3.connect(db)
-        query = 'SELECT device FROM user_agents'
-        if filter_:
-            query += f' WHERE device LIKE \'%{filter_}%\''
-        df = pd.read_sql(query, con=conn)
-        return df['device'].unique().tolist()
+        try:
+            _ensure_schema(conn)
+            query, params = _filter_query('SELECT device FROM user_agents', filter_, None, None, match, conn)
+            return [row[0] for row in conn.execute(query + ' GROUP BY device ORDER BY MIN(id)', params)]
+        finally:
+            conn.close()
     else:
         return
+
+
+def _alias_table(weights) -> tuple:
+    '''
+    Function to build the probability and alias tables of Vose's alias method for O(1) weighted sampling
+    '''
+    n = len(weights)
+    total = sum(weights)
+    if n == 0 or total <= 0:
+        raise ValueError('Cannot sample from user-agents that all have weight 0.')
+    scaled = [w * n / total for w in weights]
+    prob, alias = [1.0] * n, list(range(n))
+    small = [i for i, p in enumerate(scaled) if p < 1]
+    large = [i for i, p in enumerate(scaled) if p >= 1]
+    while small and large:
+        less, more = small.pop(), large.pop()
+        prob[less], alias[less] = scaled[less], more
+        scaled[more] -= 1 - scaled[less]
+        (small if scaled[more] < 1 else large).append(more)
+    return prob, alias
+
+
+class UARotator:
+    '''
+    Weighted user-agent rotation with sticky assignments
+    weights maps browser families, OS families (see BROWSER_FAMILIES/OS_FAMILIES) or exact user-agent strings
+    to weights, an agent's weight is the product of the weights that apply to it (1 when none do).
+    Sampling tables are built once per filter combination (filters work like check_db) and sample in O(1).
+    With a key (a domain, url or session id) the same user-agent is returned for that key until
+    sticky_ttl seconds passed, at most max_sticky keys are remembered.
+    The rotator is callable, so browser(user_agent=rotator) draws a new user-agent per browser.
+    '''
+    def __init__(self, weights=None, sticky_ttl=3600, max_sticky=100000, seed=None):
+        self.weights = dict(weights or {})
+        self.sticky_ttl = sticky_ttl
+        self.max_sticky = max_sticky
+        self.seed = seed
+        self._random = random.Random(seed)
+        self._generator = None
+        self._tables = {}
+        self._sticky = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __call__(self, key=None, **filters) -> str:
+        return self.choice(key, **filters)
+
+    def weight(self, ua_string) -> float:
+        if ua_string in self.weights:
+            return self.weights[ua_string]
+        return (self.weights.get(family(ua_string, OS_FAMILIES), 1.0)
+                * self.weights.get(family(ua_string, BROWSER_FAMILIES), 1.0))
+
+    def _table(self, device_filter, os_filter, browser_filter, match) -> tuple:
+        '''
+        Function to return the (agents, prob, alias) table for a filter, rebuilt when the database changed
+        '''
+        key = (device_filter, os_filter, browser_filter, match)
+        table, checked = self._tables.get(key, (None, 0))
+        if time.monotonic() - checked < TABLE_CHECK_INTERVAL:
+            return table
+        agents = check_db(device_filter, os_filter, browser_filter, match)
+        if not agents:
+            raise ValueError('No user-agents match the given filters.')
+        if table is None or table[0] is not agents:
+            table = (agents, *_alias_table([self.weight(ua) for ua in agents]))
+        self._tables[key] = (table, time.monotonic())
+        return table
+
+    def choice(self, key=None, device_filter=None, os_filter=None, browser_filter=None, match='contains') -> str:
+        '''
+        Function to draw a weighted random user-agent, the same one for key until it expires
+        '''
+        with self._lock:
+            if key is not None:
+                key = (urlsplit(key).hostname or key, device_filter, os_filter, browser_filter, match)
+                sticky = self._sticky.get(key)
+                if sticky is not None and sticky[1] > time.monotonic():
+                    self._sticky.move_to_end(key)
+                    return sticky[0]
+            agents, prob, alias = self._table(device_filter, os_filter, browser_filter, match)
+            i = self._random.randrange(len(agents))
+            ua = agents[i] if self._random.random() < prob[i] else agents[alias[i]]
+            if key is not None:
+                self._sticky[key] = (ua, time.monotonic() + self.sticky_ttl)
+                self._sticky.move_to_end(key)
+                while len(self._sticky) > self.max_sticky:
+                    self._sticky.popitem(last=False)
+            return ua
+
+    def forget(self, key=None):
+        '''
+        Function to drop the sticky assignments of key (a domain, url or session id), or all of them
+        '''
+        with self._lock:
+            if key is None:
+                self._sticky.clear()
+                return
+            host = urlsplit(key).hostname or key
+            for sticky_key in [k for k in self._sticky if k[0] == host]:
+                del self._sticky[sticky_key]
+
+    def sample(self, amount, device_filter=None, os_filter=None, browser_filter=None, match='contains'):
+        '''
+        Function to draw amount weighted user-agents at once with numpy, e.g. millions for load-test fixtures
+        Returns a numpy array of strings
+        '''
+        import numpy as np
+
+        with self._lock:
+            agents, prob, alias = self._table(device_filter, os_filter, browser_filter, match)
+            # One generator per rotator, created on first use to keep numpy out of the import
+            if self._generator is None:
+                self._generator = np.random.default_rng(self.seed)
+            index = self._generator.integers(0, len(agents), size=amount)
+            draws = self._generator.random(amount)
+        index = np.where(draws < np.asarray(prob)[index], index, np.asarray(alias)[index])
+        return np.asarray(agents, dtype=object)[index]
@@ -2,8 +2,66 @@ import pandas as pd
 import warnings
 
 
-def to_dataframe(table_html, has_headers=True, custom_headers=None):
+def to_dataframe(table_html, has_headers=True, custom_headers=None, engine='bs4', infer_dtypes=False):
+    '''
+    Function to convert an HTML table to a pandas DataFrame
+    engine='bs4' reads a BeautifulSoup table element cell by cell,
+    engine='lxml' accepts an HTML string, BeautifulSoup or lxml element and builds the columns directly,
+    supporting colspan/rowspan, thead/tbody/tfoot and multi-row headers (as a MultiIndex).
+    With infer_dtypes numeric and date columns are converted to their dtypes.
+    '''
+    if engine == 'lxml':
+        df = _lxml_to_dataframe(table_html, has_headers, custom_headers)
+    elif engine == 'bs4':
+        df = _bs4_to_dataframe(table_html, has_headers, custom_headers)
+    else:
+        raise ValueError(f'The engine parameter must be "bs4" or "lxml", not "{engine}".')
+    if infer_dtypes:
+        df = infer_column_dtypes(df)
+    return df
+
+
+def all_tables(source, min_rows=0, min_cols=0, require_headers=False, infer_dtypes=False) -> dict:
+    '''
+    Function to convert every table in a page to a pandas DataFrame with a single parse of the HTML
+    source can be raw HTML, a BeautifulSoup or lxml element or a Browser (its page_source is used)
+    Returns a dictionary keyed by table id, caption or index (in that order of preference).
+    Tables with less than min_rows body rows or min_cols columns, and tables without headers when
+    require_headers is set, are skipped.
+    '''
+    from lxml import etree
+
+    html = source.page_source if hasattr(source, 'page_source') else source
+    if hasattr(html, 'xpath'):
+        root = html
+    else:
+        root = etree.fromstring(html if isinstance(html, (str, bytes)) else str(html), etree.HTMLParser())
+    tables = {}
+    if root is None:
+        return tables
+    for index, table in enumerate(root.iter('table')):
+        rows = table.xpath('./tr|./thead/tr|./tbody/tr|./tfoot/tr')
+        has_headers = bool(table.xpath('./thead')) or bool(rows and rows[0].xpath('./th'))
+        if require_headers and not has_headers:
+            continue
+        _, body, foot = _split_rows(table, has_headers)
+        if len(body) + len(foot) < min_rows:
+            continue
+        df = _lxml_to_dataframe(table, has_headers)
+        if df.shape[1] < min_cols:
+            continue
+        if infer_dtypes:
+            df = infer_column_dtypes(df)
 
+        captions = table.xpath('./caption')
+        key = table.get('id') or (''.join(captions[0].itertext()).strip() if captions else '') or index
+        if key in tables:
+            key = f'{key}_{index}'
+        tables[key] = df
+    return tables
+
+
+def _bs4_to_dataframe(table_html, has_headers=True, custom_headers=None):
     if has_headers:
         if custom_headers:
             headers = custom_headers
@@ -25,17 +83,197 @@ def to_dataframe(table_html, has_headers=True, custom_headers=None):
     try:
         df = pd.DataFrame(columns=headers, data=rows)
     except ValueError:
-        cols = len(rows[0])
-        custom_cols = len(headers)
-        if cols < custom_cols:
-            warnings.warn(f'Too many headers ({custom_cols}) given for the amount of columns ({cols}).\n'
-                  f'Using first {cols} values: {", ".join(headers[:cols])}.', SyntaxWarning)
-            df = pd.DataFrame(columns=headers[:cols], data=rows)
+        headers = _fit_headers(headers, len(rows[0]))
+        df = pd.DataFrame(columns=headers, data=rows)
+
+    return df
+
+
+def _fit_headers(headers, cols) -> list:
+    '''
+    Function to cut or extend a list of headers to the amount of columns in a table
+    '''
+    custom_cols = len(headers)
+    if cols < custom_cols:
+        warnings.warn(f'Too many headers ({custom_cols}) given for the amount of columns ({cols}).\n'
+                      f'Using first {cols} values: {", ".join(map(str, headers[:cols]))}.', SyntaxWarning)
+        return list(headers[:cols])
+    if cols > custom_cols:
+        warnings.warn(f'Too few headers ({custom_cols}) given for the amount of columns ({cols}).\n'
+                      f'Adding col_n as column names for the remaining {cols - custom_cols} columns.',
+                      SyntaxWarning)
+        return list(headers) + ['col_' + str(x) for x in range(custom_cols + 1, cols + 1)]
+    return list(headers)
+
+
+def _lxml_table(table_html):
+    '''
+    Function to get an lxml table element from an HTML string, BeautifulSoup element or lxml element
+    '''
+    from lxml import etree
+
+    if isinstance(table_html, (str, bytes)):
+        table = etree.fromstring(table_html, etree.HTMLParser())
+    elif hasattr(table_html, 'xpath'):
+        table = table_html
+    else:
+        table = etree.fromstring(str(table_html), etree.HTMLParser())
+    if table is None:
+        raise ValueError('No table element found in the given HTML.')
+    if table.tag != 'table':
+        tables = table.xpath('.//table')
+        if not tables:
+            raise ValueError('No table element found in the given HTML.')
+        table = tables[0]
+    return table
+
+
+def _grid_columns(rows) -> tuple:
+    '''
+    Function to lay out table rows as a list of columns, resolving colspan and rowspan
+    Returns the columns and the amount of rows
+    '''
+    columns = []
+    spans = {}
+    n_rows = 0
+    for row in rows:
+        col = 0
+        for cell in row:
+            if cell.tag != 'td' and cell.tag != 'th':
+                continue
+            if spans:
+                while col in spans:
+                    col = _fill_span(columns, spans, col, n_rows)
+            text = (cell.text or '').strip() if not len(cell) else ''.join(cell.itertext()).strip()
+            colspan = cell.get('colspan')
+            rowspan = cell.get('rowspan')
+            if colspan is None and rowspan is None:
+                if col == len(columns):
+                    columns.append([None] * n_rows)
+                columns[col].append(text)
+                col += 1
+                continue
+            rowspan = _span(rowspan)
+            for _ in range(_span(colspan)):
+                if col == len(columns):
+                    columns.append([None] * n_rows)
+                columns[col].append(text)
+                if rowspan > 1:
+                    spans[col] = [rowspan - 1, text]
+                col += 1
+        if spans:
+            for span_col in sorted(c for c in spans if c >= col):
+                _fill_span(columns, spans, span_col, n_rows)
+        n_rows += 1
+        for column in columns[col:]:
+            if len(column) < n_rows:
+                column.append(None)
+    return columns, n_rows
+
+
+def _fill_span(columns, spans, col, n_rows) -> int:
+    while len(columns) <= col:
+        columns.append([None] * n_rows)
+    remaining, text = spans[col]
+    columns[col].append(text)
+    if remaining == 1:
+        del spans[col]
+    else:
+        spans[col][0] = remaining - 1
+    return col + 1
+
+
+def _span(value) -> int:
+    try:
+        return max(int(value or 1), 1)
+    except ValueError:
+        return 1
+
+
+def _split_rows(table, has_headers=True) -> tuple:
+    '''
+    Function to split the rows of an lxml table into header, body and footer rows
+    Without a thead the leading rows of only th cells (or the first row) are the header
+    '''
+    head = table.xpath('./thead/tr')
+    body = table.xpath('./tbody/tr|./tr')
+    foot = table.xpath('./tfoot/tr')
+    if has_headers and not head:
+        while body and not body[0].xpath('./td') and body[0].xpath('./th'):
+            head.append(body.pop(0))
+        if not head and body:
+            head.append(body.pop(0))
+    elif not has_headers:
+        body = head + body
+        head = []
+    return head, body, foot
+
+
+def _lxml_to_dataframe(table_html, has_headers=True, custom_headers=None):
+    table = _lxml_table(table_html)
+    head, body, foot = _split_rows(table, has_headers)
+
+    columns, n_rows = _grid_columns(body + foot)
+
+    if custom_headers:
+        headers = list(custom_headers)
+    elif head:
+        header_columns, n_header_rows = _grid_columns(head)
+        if n_header_rows == 1:
+            headers = [column[0] or '' for column in header_columns]
         else:
-            warnings.warn(f'Too few headers ({custom_cols}) given for the amount of columns ({cols}).\n'
-                          f'Adding col_n as column names for the remaining {cols - custom_cols} columns.',
-                          SyntaxWarning)
-            headers = headers + ['col_' + str(x) for x in range(custom_cols + 1, cols + 1)]
-            df = pd.DataFrame(columns=headers, data=rows)
+            headers = [tuple(value or '' for value in column) for column in header_columns]
+    else:
+        warnings.warn('Table contains no headers and no custom headers were supplied.\n'
+                      'Setting column names to col_1, col_2 ... col_n.', SyntaxWarning)
+        headers = ['col_' + str(x) for x in range(1, len(columns) + 1)]
+
+    if len(headers) != len(columns) and columns:
+        headers = _fit_headers(headers, len(columns))
+    if not columns:
+        columns = [[] for _ in headers]
+
+    if any(isinstance(header, tuple) for header in headers):
+        depth = max(len(header) for header in headers if isinstance(header, tuple))
+        headers = pd.MultiIndex.from_tuples([header if isinstance(header, tuple) else (header,) + ('',) * (depth - 1)
+                                             for header in headers])
+    df = pd.DataFrame(dict(enumerate(columns[:len(headers)])))
+    df.columns = headers
+    return df
 
+
+def infer_column_dtypes(df, thousands=',', dates=True):
+    '''
+    Function to convert text columns of a DataFrame to numeric or datetime dtypes
+    A column is only converted when every non-empty value can be converted
+    '''
+    df = df.copy()
+    for i in range(df.shape[1]):
+        values = df.iloc[:, i]
+        if values.dtype != object and not pd.api.types.is_string_dtype(values.dtype):
+            continue
+        text = pd.Series(values, dtype=object).str.strip()
+        text = text.mask(text == '')
+        present = text.notna()
+        if not present.any():
+            continue
+        cleaned = text.str.replace(thousands, '', regex=False) if thousands else text
+        numbers = pd.to_numeric(cleaned, errors='coerce')
+        if numbers[present].notna().all():
+            df.isetitem(i, numbers)
+            continue
+        if dates and _parses_as_dates(text[present].head(100)):
+            parsed = _to_datetime(text)
+            if parsed[present].notna().all():
+                df.isetitem(i, parsed)
     return df
+
+
+def _parses_as_dates(sample) -> bool:
+    return bool(_to_datetime(sample).notna().all())
+
+
+def _to_datetime(values):
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', UserWarning)
+        return pd.to_datetime(values, errors='coerce')
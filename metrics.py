@@ -0,0 +1,171 @@
+import csv
+import io
+import threading
+from bisect import bisect_left
+from typing import Union
+
+# Upper bounds in seconds of the latency histogram buckets, the last bucket (+Inf) is implicit
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+QUANTILES = (0.5, 0.9, 0.99)
+CSV_COLUMNS = ['kind', 'name', 'exception', 'count', 'sum', 'min', 'max', 'mean', 'p50', 'p90', 'p99']
+
+
+class Histogram:
+    '''
+    Fixed bucket histogram of durations in seconds
+    '''
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.min = None
+        self.max = None
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+
+    def quantile(self, q) -> Union[float, None]:
+        '''
+        Function to estimate a quantile by linear interpolation within its bucket
+        '''
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            if count and seen + count >= rank:
+                lower = self.buckets[index - 1] if index else 0.0
+                upper = self.buckets[index] if index < len(self.buckets) else self.max
+                estimate = lower + (upper - lower) * (rank - seen) / count
+                return min(max(estimate, self.min), self.max)
+            seen += count
+        return self.max
+
+    def snapshot(self) -> dict:
+        cumulative, total = {}, 0
+        for bound, count in zip(self.buckets + ('+Inf',), self.counts):
+            total += count
+            cumulative[bound] = total
+        snapshot = {'count': self.count, 'sum': self.sum, 'min': self.min, 'max': self.max,
+                    'mean': self.sum / self.count if self.count else None}
+        for q in QUANTILES:
+            snapshot[f'p{int(q * 100)}'] = self.quantile(q)
+        snapshot['buckets'] = cumulative
+        return snapshot
+
+
+class Metrics:
+    '''
+    In-process registry of WebDriver command latencies and error counts
+    Every Browser records into its own Metrics, which forwards to the process wide METRICS as parent.
+    Errors are counted per command and exception type; handled errors are the ones error_handling
+    turned into warnings, counted per Browser method.
+    '''
+    def __init__(self, parent: 'Metrics' = None, buckets=LATENCY_BUCKETS):
+        self.parent = parent
+        self.buckets = buckets
+        self.commands = {}
+        self.errors = {}
+        self.handled = {}
+        self._lock = threading.Lock()
+
+    def observe(self, command, seconds):
+        with self._lock:
+            histogram = self.commands.get(command)
+            if histogram is None:
+                histogram = self.commands[command] = Histogram(self.buckets)
+            histogram.observe(seconds)
+        if self.parent is not None:
+            self.parent.observe(command, seconds)
+
+    def error(self, command, exception):
+        self._count(self.errors, command, exception)
+        if self.parent is not None:
+            self.parent.error(command, exception)
+
+    def handled_error(self, method, exception):
+        self._count(self.handled, method, exception)
+        if self.parent is not None:
+            self.parent.handled_error(method, exception)
+
+    def _count(self, table, name, exception):
+        exception_name = exception if isinstance(exception, str) else exception.__class__.__name__
+        with self._lock:
+            counts = table.setdefault(name, {})
+            counts[exception_name] = counts.get(exception_name, 0) + 1
+
+    @property
+    def round_trips(self) -> int:
+        with self._lock:
+            return sum(histogram.count for histogram in self.commands.values())
+
+    def reset(self):
+        with self._lock:
+            self.commands = {}
+            self.errors = {}
+            self.handled = {}
+
+    def snapshot(self) -> dict:
+        '''
+        Function to export all metrics as a dictionary, durations are in seconds
+        '''
+        with self._lock:
+            return {'round_trips': sum(histogram.count for histogram in self.commands.values()),
+                    'commands': {command: histogram.snapshot() for command, histogram in self.commands.items()},
+                    'errors': {command: dict(counts) for command, counts in self.errors.items()},
+                    'handled_errors': {method: dict(counts) for method, counts in self.handled.items()}}
+
+    def to_prometheus(self, prefix='webdriver') -> str:
+        '''
+        Function to export all metrics in the Prometheus text exposition format
+        '''
+        snapshot = self.snapshot()
+        lines = [f'# HELP {prefix}_command_duration_seconds Latency of WebDriver command round trips.',
+                 f'# TYPE {prefix}_command_duration_seconds histogram']
+        for command, histogram in snapshot['commands'].items():
+            label = f'command="{_escape(command)}"'
+            for bound, count in histogram['buckets'].items():
+                lines.append(f'{prefix}_command_duration_seconds_bucket{{{label},le="{bound}"}} {count}')
+            lines.append(f'{prefix}_command_duration_seconds_sum{{{label}}} {histogram["sum"]}')
+            lines.append(f'{prefix}_command_duration_seconds_count{{{label}}} {histogram["count"]}')
+        for name, label_name, key, help_text in (
+                ('command_errors_total', 'command', 'errors', 'WebDriver commands that raised, per exception.'),
+                ('handled_errors_total', 'method', 'handled_errors', 'Errors turned into warnings, per exception.')):
+            lines += [f'# HELP {prefix}_{name} {help_text}', f'# TYPE {prefix}_{name} counter']
+            for label, counts in snapshot[key].items():
+                for exception, count in counts.items():
+                    lines.append(f'{prefix}_{name}{{{label_name}="{_escape(label)}",'
+                                 f'exception="{_escape(exception)}"}} {count}')
+        return '\n'.join(lines) + '\n'
+
+    def to_csv(self, path=None) -> str:
+        '''
+        Function to export one row per command and per error as CSV, written to path when given
+        '''
+        snapshot = self.snapshot()
+        output = io.StringIO()
+        writer = csv.DictWriter(output, CSV_COLUMNS, extrasaction='ignore', lineterminator='\n')
+        writer.writeheader()
+        for command, histogram in snapshot['commands'].items():
+            writer.writerow(dict(histogram, kind='command', name=command))
+        for kind, key in (('error', 'errors'), ('handled_error', 'handled_errors')):
+            for name, counts in snapshot[key].items():
+                for exception, count in counts.items():
+                    writer.writerow({'kind': kind, 'name': name, 'exception': exception, 'count': count})
+        if path is not None:
+            with open(path, 'w', newline='', encoding='utf-8') as f:
+                f.write(output.getvalue())
+        return output.getvalue()
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+# Process wide metrics of all sessions
+METRICS = Metrics()
@@ -0,0 +1,220 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from contextlib import contextmanager
+from typing import NamedTuple, Union
+
+DIRNAME_ORIGIN = os.path.dirname(os.path.realpath(__file__))
+DIRNAME_CACHE = os.path.join(DIRNAME_ORIGIN, 'page_cache')
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS pages (
+    key TEXT PRIMARY KEY,
+    url TEXT NOT NULL,
+    user_agent TEXT,
+    viewport TEXT,
+    digest TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    status INTEGER,
+    etag TEXT,
+    last_modified TEXT,
+    stored REAL NOT NULL,
+    accessed REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_pages_accessed ON pages (accessed);
+CREATE INDEX IF NOT EXISTS idx_pages_digest ON pages (digest);
+CREATE TABLE IF NOT EXISTS objects (
+    digest TEXT PRIMARY KEY,
+    size INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS meta (
+    name TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+'''
+
+
+class CachedPage(NamedTuple):
+    url: str
+    html: str
+    status: Union[int, None]
+    etag: Union[str, None]
+    last_modified: Union[str, None]
+    stored: float
+    fresh: bool
+
+
+class PageCache:
+    '''
+    Persistent on-disk cache of page HTML keyed on url, user-agent and viewport
+    Bodies are stored compressed and content-addressed (identical pages are stored once), entries expire
+    after ttl seconds and the least recently used entries are evicted when the cache exceeds max_bytes.
+    Expired entries with an ETag or Last-Modified value can be revalidated with conditional_headers().
+    '''
+    def __init__(self, folder=DIRNAME_CACHE, ttl=24 * 60 * 60, max_bytes=1024 ** 3):
+        self.folder = folder
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        os.makedirs(os.path.join(folder, 'objects'), exist_ok=True)
+        with self._connect() as conn:
+            conn.executescript(SCHEMA)
+        with self._transaction() as conn:
+            if conn.execute("SELECT 1 FROM meta WHERE name = 'bytes'").fetchone() is None:
+                # Caches created before the object table count their bytes once
+                conn.execute('INSERT OR IGNORE INTO objects SELECT digest, MAX(size) FROM pages GROUP BY digest')
+                conn.execute("INSERT INTO meta VALUES ('bytes', (SELECT COALESCE(SUM(size), 0) FROM objects))")
+
+    @contextmanager
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(os.path.join(self.folder, 'index.db'), timeout=30)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    @contextmanager
+    def _transaction(self) -> sqlite3.Connection:
+        '''
+        Function to run statements in a transaction that holds the write lock from the start, so that object files
+        are written and removed consistently with the rows referencing them
+        '''
+        with self._connect() as conn:
+            conn.execute('BEGIN IMMEDIATE')
+            yield conn
+
+    def _release(self, conn, digest) -> int:
+        '''
+        Function to remove the object file of digest when no entry references it any more, returns the bytes freed
+        '''
+        if conn.execute('SELECT 1 FROM pages WHERE digest = ? LIMIT 1', (digest,)).fetchone() is not None:
+            return 0
+        row = conn.execute('SELECT size FROM objects WHERE digest = ?', (digest,)).fetchone()
+        if row is None:
+            return 0
+        conn.execute('DELETE FROM objects WHERE digest = ?', (digest,))
+        conn.execute("UPDATE meta SET value = value - ? WHERE name = 'bytes'", (row[0],))
+        try:
+            os.remove(self._object_path(digest))
+        except FileNotFoundError:
+            pass
+        return row[0]
+
+    def _object_path(self, digest) -> str:
+        return os.path.join(self.folder, 'objects', digest[:2], digest)
+
+    @staticmethod
+    def key(url, user_agent=None, viewport=None) -> str:
+        return hashlib.sha256('\n'.join([url, user_agent or '', str(viewport or '')]).encode()).hexdigest()
+
+    def get(self, url, user_agent=None, viewport=None, allow_stale=False) -> Union[CachedPage, None]:
+        '''
+        Function to read a cached page, returns None when there is no (fresh, unless allow_stale) entry
+        '''
+        key = self.key(url, user_agent, viewport)
+        with self._connect() as conn:
+            row = conn.execute('SELECT digest, status, etag, last_modified, stored FROM pages WHERE key = ?',
+                               (key,)).fetchone()
+            if row is None:
+                return None
+            digest, status, etag, last_modified, stored = row
+            fresh = time.time() - stored < self.ttl
+            if not fresh and not allow_stale:
+                return None
+            try:
+                with open(self._object_path(digest), 'rb') as f:
+                    html = zlib.decompress(f.read()).decode()
+            except (OSError, zlib.error):
+                html = None
+            if html is not None:
+                conn.execute('UPDATE pages SET accessed = ? WHERE key = ?', (time.time(), key))
+        if html is None:
+            with self._transaction() as conn:
+                conn.execute('DELETE FROM pages WHERE key = ?', (key,))
+                self._release(conn, digest)
+            return None
+        return CachedPage(url, html, status, etag, last_modified, stored, fresh)
+
+    def put(self, url, html, user_agent=None, viewport=None, status=200, etag=None, last_modified=None):
+        '''
+        Function to store the HTML of a page and evict least recently used entries when the cache is full
+        '''
+        data = zlib.compress(html.encode(), 6)
+        digest = hashlib.sha256(data).hexdigest()
+        path = self._object_path(digest)
+        key = self.key(url, user_agent, viewport)
+        now = time.time()
+        with self._transaction() as conn:
+            if not os.path.exists(path):
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+                with open(tmp_path, 'wb') as f:
+                    f.write(data)
+                os.replace(tmp_path, path)
+            previous = conn.execute('SELECT digest FROM pages WHERE key = ?', (key,)).fetchone()
+            conn.execute('INSERT OR REPLACE INTO pages VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                         (key, url, user_agent, str(viewport or ''), digest, len(data), status, etag, last_modified,
+                          now, now))
+            if conn.execute('INSERT OR IGNORE INTO objects VALUES (?, ?)', (digest, len(data))).rowcount:
+                conn.execute("UPDATE meta SET value = value + ? WHERE name = 'bytes'", (len(data),))
+            if previous is not None and previous[0] != digest:
+                self._release(conn, previous[0])
+            total = conn.execute("SELECT value FROM meta WHERE name = 'bytes'").fetchone()[0]
+        if total > self.max_bytes:
+            self.evict()
+
+    def refresh(self, url, user_agent=None, viewport=None):
+        '''
+        Function to mark an entry fresh again, e.g. after the server answered 304 Not Modified
+        '''
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute('UPDATE pages SET stored = ?, accessed = ? WHERE key = ?',
+                         (now, now, self.key(url, user_agent, viewport)))
+
+    @staticmethod
+    def conditional_headers(page: CachedPage) -> dict:
+        '''
+        Function to build If-None-Match/If-Modified-Since headers to revalidate a stale entry
+        '''
+        headers = {}
+        if page is not None and page.etag:
+            headers['If-None-Match'] = page.etag
+        if page is not None and page.last_modified:
+            headers['If-Modified-Since'] = page.last_modified
+        return headers
+
+    def size(self) -> int:
+        '''
+        Function to get the bytes of all stored objects, kept up to date by put() instead of summed on every call
+        '''
+        with self._connect() as conn:
+            return conn.execute("SELECT value FROM meta WHERE name = 'bytes'").fetchone()[0]
+
+    def evict(self):
+        '''
+        Function to remove least recently used entries until the cache fits in max_bytes
+        '''
+        with self._transaction() as conn:
+            total = conn.execute("SELECT value FROM meta WHERE name = 'bytes'").fetchone()[0]
+            if total <= self.max_bytes:
+                return
+            for key, digest in conn.execute('SELECT key, digest FROM pages ORDER BY accessed').fetchall():
+                conn.execute('DELETE FROM pages WHERE key = ?', (key,))
+                total -= self._release(conn, digest)
+                if total <= self.max_bytes:
+                    break
+
+    def clear(self):
+        with self._transaction() as conn:
+            for (digest,) in conn.execute('SELECT digest FROM objects').fetchall():
+                try:
+                    os.remove(self._object_path(digest))
+                except FileNotFoundError:
+                    pass
+            conn.execute('DELETE FROM pages')
+            conn.execute('DELETE FROM objects')
+            conn.execute("UPDATE meta SET value = 0 WHERE name = 'bytes'")
@@ -0,0 +1,129 @@
+import os
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+from multiprocessing import shared_memory
+from typing import Any, Callable, Iterable, Iterator
+
+# Documents of at least this many bytes are handed to workers through shared memory instead of being pickled
+SHARED_MEMORY_THRESHOLD = 1024 ** 2
+
+
+def _attach(name) -> shared_memory.SharedMemory:
+    '''
+    Function to open a shared memory block created by the parent without letting this process' resource tracker
+    remove it when the worker exits
+    '''
+    try:
+        return shared_memory.SharedMemory(name, track=False)
+    except TypeError:
+        from multiprocessing import resource_tracker
+
+        # Before Python 3.13 attaching always registers the block, workers run one task at a time
+        register = resource_tracker.register
+        resource_tracker.register = lambda name, rtype: None
+        try:
+            return shared_memory.SharedMemory(name)
+        finally:
+            resource_tracker.register = register
+
+
+def _run(payload, func, args, kwargs) -> Any:
+    '''
+    Function running in a worker process: reads the HTML (from shared memory for large documents) and calls func
+    '''
+    if isinstance(payload, tuple):
+        name, size = payload
+        shm = _attach(name)
+        try:
+            html = bytes(shm.buf[:size]).decode()
+        finally:
+            shm.close()
+    else:
+        html = payload
+    return func(html, *args, **kwargs)
+
+
+def select_records(html, selector, attributes=(), text=False) -> list:
+    '''
+    Function to read attributes (and text) of all elements matching a CSS selector from static HTML,
+    like Browser.get_element does on a live page
+    '''
+    import bs4 as bs
+
+    records = []
+    for element in bs.BeautifulSoup(html, 'lxml').select(selector):
+        record = {attribute: element.get(attribute) for attribute in attributes}
+        if text:
+            record['text'] = element.get_text(' ', strip=True)
+        records.append(record)
+    return records
+
+
+class ParsePool:
+    '''
+    Pool of worker processes that parse and extract page HTML, so the thread driving a browser can move on
+    to the next navigation while earlier pages are parsed on other cores
+    func is called as func(html, *args, **kwargs) in a worker and must be importable by it (a module level
+    function, e.g. html_table_parse.all_tables or select_records). Documents larger than shm_threshold bytes
+    are passed through shared memory. At most max_pending documents are queued, submit() blocks beyond that.
+    '''
+    def __init__(self, workers=None, shm_threshold=SHARED_MEMORY_THRESHOLD, max_pending=None):
+        self.workers = workers or os.cpu_count() or 1
+        self.shm_threshold = shm_threshold
+        self._executor = ProcessPoolExecutor(max_workers=self.workers)
+        self._slots = threading.BoundedSemaphore(max_pending or self.workers * 4)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def submit(self, html, func: Callable, *args, **kwargs) -> Future:
+        '''
+        Function to parse html with func in a worker process, returns a Future of its result
+        '''
+        self._slots.acquire()
+        shm = None
+        try:
+            data = html.encode() if len(html) >= self.shm_threshold // 4 else None
+            if data is not None and len(data) >= self.shm_threshold:
+                shm = shared_memory.SharedMemory(create=True, size=len(data))
+                shm.buf[:len(data)] = data
+                payload = (shm.name, len(data))
+            else:
+                payload = html
+            future = self._executor.submit(_run, payload, func, args, kwargs)
+        except BaseException:
+            self._release(shm)
+            raise
+        future.add_done_callback(lambda _: self._release(shm))
+        return future
+
+    def _release(self, shm):
+        if shm is not None:
+            shm.close()
+            shm.unlink()
+        self._slots.release()
+
+    def submit_page(self, driver, func: Callable, *args, **kwargs) -> Future:
+        '''
+        Function to hand the current page of a Browser to a worker, costs one round trip for page_source
+        '''
+        return self.submit(driver.page_source, func, *args, **kwargs)
+
+    def map(self, func: Callable, documents: Iterable[str], *args, **kwargs) -> Iterator[Any]:
+        '''
+        Function to parse many documents and yield the results in input order
+        At most max_pending documents are held at a time
+        '''
+        futures = []
+        for html in documents:
+            futures.append(self.submit(html, func, *args, **kwargs))
+            while futures and futures[0].done():
+                yield futures.pop(0).result()
+        for future in futures:
+            yield future.result()
+
+    def close(self, wait=True):
+        self._executor.shutdown(wait=wait)
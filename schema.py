@@ -0,0 +1,189 @@
+import json
+import re
+from typing import Any, Union
+from urllib.parse import urljoin
+
+# Helpers shared by every compiled schema script
+SCHEMA_PRELUDE = '''
+function one(scope, selector) { return selector === null ? scope : scope.querySelector(selector); }
+function all(scope, selector) { return Array.prototype.slice.call(scope.querySelectorAll(selector)); }
+function read(el, how, name) {
+    if (!el) return null;
+    if (how === 'text') return el.textContent;
+    if (how === 'html') return el.innerHTML;
+    if (how === 'attribute') return el.getAttribute(name);
+    var value = el[name];
+    return (value === undefined || typeof value === 'function' || (typeof value === 'object' && value !== null))
+        ? el.getAttribute(name) : value;
+}
+'''
+
+
+def _number(value) -> Union[float, int, None]:
+    match = re.search(r'-?\d[\d,]*(\.\d+)?|-?\.\d+', value.replace(' ', ''))
+    if match is None:
+        return None
+    number = float(match.group(0).replace(',', ''))
+    return int(number) if number.is_integer() and '.' not in match.group(0) else number
+
+
+# Transforms by name, applied in Python to the values of both the browser and the static HTML path
+TRANSFORMS = {
+    'strip': lambda value: value.strip(),
+    'lower': lambda value: value.lower(),
+    'upper': lambda value: value.upper(),
+    'int': lambda value: int(float(value.replace(',', '').strip())),
+    'float': lambda value: float(value.replace(',', '').strip()),
+    'number': _number,
+    'bool': lambda value: value not in (None, '', 'false', 'False', '0', False),
+}
+FIELD_KEYS = {'selector', 'attribute', 'property', 'html', 'multiple', 'fields', 'transform', 'default'}
+
+
+class Schema:
+    '''
+    Declarative description of the fields of a page, compiled once into a single JavaScript function
+    fields maps names to a CSS selector (text of the first match, 'a@href' reads an attribute) or a dictionary with:
+        selector: CSS selector, relative to the enclosing element for nested fields (None is the element itself)
+        attribute / property / html: read an attribute, a DOM property or the inner HTML instead of the text
+        multiple: return a list for all matches instead of the first match
+        fields: nested schema, the value becomes a dictionary (or a list of them with multiple)
+        transform: name from TRANSFORMS ('absolute_url' resolves against the page url), a function, or a list of those
+        default: value when nothing matched or a transform failed
+    Text is whitespace-normalized. The same schema runs on a Browser (Browser.extract) and on static HTML (from_html).
+    '''
+    def __init__(self, fields: dict):
+        self.fields = {name: self._normalize(name, spec) for name, spec in fields.items()}
+        self.script = (SCHEMA_PRELUDE + 'var e0 = document;\nreturn {base: document.baseURI, data: '
+                       + self._js_object(self.fields, 0) + '};')
+
+    @staticmethod
+    def _normalize(name, spec) -> dict:
+        if isinstance(spec, str):
+            selector, _, attribute = spec.partition('@')
+            spec = {'selector': selector.strip() or None, 'attribute': attribute.strip() or None}
+        if not isinstance(spec, dict):
+            raise TypeError(f'Field "{name}" must be of type "str" or "dict", not type "{type(spec).__name__}".')
+        unknown = set(spec) - FIELD_KEYS
+        if unknown:
+            raise ValueError(f'Unknown keys {", ".join(sorted(unknown))} in field "{name}".')
+        field = dict(spec)
+        field.setdefault('selector', None)
+        if field.get('multiple') and field['selector'] is None:
+            raise ValueError(f'Field "{name}" has multiple set and needs a selector.')
+        if field.get('fields') is not None:
+            field['fields'] = {key: Schema._normalize(key, value) for key, value in field['fields'].items()}
+        transforms = field.get('transform') or []
+        field['transform'] = transforms if isinstance(transforms, (list, tuple)) else [transforms]
+        for transform in field['transform']:
+            if not callable(transform) and transform not in TRANSFORMS and transform != 'absolute_url':
+                raise ValueError(f'Unknown transform "{transform}" in field "{name}", use a function or one of '
+                                 f'{", ".join(list(TRANSFORMS) + ["absolute_url"])}.')
+        return field
+
+    @staticmethod
+    def _how(field) -> tuple:
+        if field.get('attribute'):
+            return 'attribute', field['attribute']
+        if field.get('property'):
+            return 'property', field['property']
+        return ('html', None) if field.get('html') else ('text', None)
+
+    def _js_object(self, fields, depth) -> str:
+        return '{' + ', '.join(f'{json.dumps(name)}: {self._js_value(field, depth)}'
+                               for name, field in fields.items()) + '}'
+
+    def _js_value(self, field, depth) -> str:
+        '''
+        Function to generate the JavaScript expression reading a field from the element in variable e<depth>
+        '''
+        scope, var = f'e{depth}', f'e{depth + 1}'
+        selector = json.dumps(field['selector'])
+        if field.get('fields') is not None:
+            body = f'function ({var}) {{ return {var} ? {self._js_object(field["fields"], depth + 1)} : null; }}'
+        else:
+            how, name = self._how(field)
+            body = f'function ({var}) {{ return read({var}, {json.dumps(how)}, {json.dumps(name)}); }}'
+        if field.get('multiple'):
+            return f'all({scope}, {selector}).map({body})'
+        return f'({body})(one({scope}, {selector}))'
+
+    def _static_value(self, field, element) -> Any:
+        if field.get('multiple'):
+            return [self._static_read(field, match) for match in element.select(field['selector'])]
+        match = element if field['selector'] is None else element.select_one(field['selector'])
+        return self._static_read(field, match)
+
+    def _static_read(self, field, element) -> Any:
+        if element is None:
+            return None
+        if field.get('fields') is not None:
+            return {name: self._static_value(nested, element) for name, nested in field['fields'].items()}
+        how, name = self._how(field)
+        if how == 'text':
+            return element.get_text()
+        if how == 'html':
+            return element.decode_contents()
+        value = element.get(name)
+        return ' '.join(value) if isinstance(value, list) else value
+
+    def from_html(self, html, base_url=None) -> dict:
+        '''
+        Function to run the schema on static HTML (a string or BeautifulSoup), e.g. from Fetcher or ParsePool
+        '''
+        import bs4 as bs
+
+        soup = html if isinstance(html, bs.BeautifulSoup) else bs.BeautifulSoup(html, 'lxml')
+        if base_url is None:
+            base = soup.select_one('base[href]')
+            base_url = base['href'] if base else None
+        return self.finish({name: self._static_value(field, soup) for name, field in self.fields.items()}, base_url)
+
+    def finish(self, raw, base_url=None) -> dict:
+        '''
+        Function to normalize text and apply transforms and defaults to the raw values of both paths
+        '''
+        return {name: self._finish(field, raw.get(name), base_url) for name, field in self.fields.items()}
+
+    def _finish(self, field, value, base_url) -> Any:
+        if field.get('multiple'):
+            return [self._finish(dict(field, multiple=False), item, base_url) for item in value or []]
+        if value is None:
+            return field.get('default')
+        if field.get('fields') is not None:
+            return {name: self._finish(nested, value.get(name), base_url) for name, nested in field['fields'].items()}
+        if self._how(field)[0] == 'text':
+            value = ' '.join(value.split())
+        try:
+            for transform in field['transform']:
+                if value is None:
+                    break
+                if transform == 'absolute_url':
+                    value = urljoin(base_url or '', value)
+                else:
+                    value = (transform if callable(transform) else TRANSFORMS[transform])(value)
+        except (ValueError, TypeError, AttributeError):
+            return field.get('default')
+        return field.get('default') if value is None else value
+
+
+def compile_schema(schema: Union[Schema, dict], cache: dict = None) -> Schema:
+    '''
+    Function to compile a schema dictionary, reusing the compiled Schema from cache when it was compiled before
+    '''
+    if isinstance(schema, Schema):
+        return schema
+    if cache is None:
+        return Schema(schema)
+    key = json.dumps(schema, sort_keys=True, default=lambda value: f'{value.__qualname__}:{id(value)}')
+    compiled = cache.get(key)
+    if compiled is None:
+        compiled = cache[key] = Schema(schema)
+    return compiled
+
+
+def extract_html(html, schema: Union[Schema, dict], base_url=None) -> dict:
+    '''
+    Function to run a schema on static HTML, picklable for ParsePool.submit(html, extract_html, schema)
+    '''
+    return compile_schema(schema).from_html(html, base_url)
@@ -0,0 +1,318 @@
+import csv
+import importlib.util
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+import warnings
+from typing import Iterable
+
+
+class Sink:
+    '''
+    Base class for streaming extracted records to disk in batches
+    Records are dictionaries, or lists/tuples when columns are given (e.g. the output of Browser.get_timed).
+    At most batch_size records are buffered and a background thread also writes the buffer when flush_interval
+    seconds passed since the last write, so a crash or a stalled crawl loses at most one batch.
+    A batch that fails to write is moved to rejected and the error is raised (or warned about when the
+    background thread wrote it), so later writes are not blocked by it. Only the newest max_rejected records
+    are kept in memory, older ones are appended to the JSON Lines file rejected_path.
+    A flush_interval of None only writes full batches.
+    Subclasses implement _write_batch(records) and optionally _close().
+    '''
+    max_rejected = 10000
+
+    def __init__(self, path, batch_size=1000, flush_interval=5.0, columns=None):
+        self.path = path
+        self.rejected_path = os.fspath(path).rstrip('/\\') + '.rejected.jsonl'
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.columns = list(columns) if columns else None
+        self.written = 0
+        self.rejected = []
+        self._buffer = []
+        self._last_flush = time.monotonic()
+        self._lock = threading.Lock()
+        self._closed = False
+        self._stopped = threading.Event()
+        self._flusher = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _record(self, record) -> dict:
+        if isinstance(record, dict):
+            return record
+        if self.columns and isinstance(record, (list, tuple)):
+            return dict(zip(self.columns, record))
+        if hasattr(record, '_asdict'):
+            return record._asdict()
+        raise TypeError(f'Records must be of type "dict" (or "list"/"tuple" with columns), '
+                        f'not type "{type(record).__name__}".')
+
+    def write(self, record):
+        '''
+        Function to add a single record to the buffer, writing the buffer when it is full or due
+        '''
+        with self._lock:
+            if self._closed:
+                raise ValueError(f'Cannot write to a closed {self.__class__.__name__}.')
+            self._buffer.append(self._record(record))
+            if self._flusher is None and self.flush_interval:
+                # Started on the first write, so a subclass that fails in __init__ leaves no thread behind
+                self._flusher = threading.Thread(target=self._flush_periodically, daemon=True)
+                self._flusher.start()
+            if len(self._buffer) >= self.batch_size or (
+                    self.flush_interval and time.monotonic() - self._last_flush >= self.flush_interval):
+                self._flush()
+
+    def write_many(self, records: Iterable):
+        '''
+        Function to add records from any iterable (a list, a generator or a pandas DataFrame) without
+        materializing it
+        '''
+        if hasattr(records, 'itertuples') and hasattr(records, 'columns'):
+            columns = [str(c) for c in records.columns]
+            records = (dict(zip(columns, row)) for row in records.itertuples(index=False, name=None))
+        for record in records:
+            self.write(record)
+
+    def flush(self):
+        with self._lock:
+            self._flush()
+
+    def _flush(self):
+        if self._buffer:
+            records, self._buffer = self._buffer, []
+            try:
+                self._write_batch(records)
+            except Exception:
+                self._reject(records)
+                raise
+            self.written += len(records)
+        self._last_flush = time.monotonic()
+
+    def _flush_periodically(self):
+        while not self._stopped.wait(max(self._last_flush + self.flush_interval - time.monotonic(), 0.05)):
+            with self._lock:
+                if self._closed:
+                    return
+                if self._buffer and time.monotonic() - self._last_flush >= self.flush_interval:
+                    size = len(self._buffer)
+                    try:
+                        self._flush()
+                    except Exception as e:
+                        warnings.warn(f'Writing {size} records to {self.path} failed, they were moved to rejected: '
+                                      f'{e}', UserWarning)
+
+    def _reject(self, records):
+        self.rejected += records
+        overflow = len(self.rejected) - self.max_rejected
+        if overflow > 0:
+            with open(self.rejected_path, 'a', encoding='utf-8') as f:
+                f.write(''.join(json.dumps(record, default=str) + '\n' for record in self.rejected[:overflow]))
+            del self.rejected[:overflow]
+
+    def close(self):
+        self._stopped.set()
+        with self._lock:
+            if self._closed:
+                return
+            try:
+                self._flush()
+            finally:
+                self._closed = True
+                self._close()
+
+    def _write_batch(self, records):
+        raise NotImplementedError
+
+    def _close(self):
+        pass
+
+
+class CSVSink(Sink):
+    '''
+    Appends records to a CSV file, the header is taken from columns or the first record
+    Keys that are not in the header are dropped with a warning
+    '''
+    def __init__(self, path, batch_size=1000, flush_interval=5.0, columns=None, fsync=False, **fmtparams):
+        super(CSVSink, self).__init__(path, batch_size, flush_interval, columns)
+        self.fsync = fsync
+        self.fmtparams = fmtparams
+        self._file = None
+        self._writer = None
+        self._warned = False
+
+    def _write_batch(self, records):
+        if self._writer is None:
+            new_file = not os.path.exists(self.path) or os.path.getsize(self.path) == 0
+            if not new_file and not self.columns:
+                with open(self.path, newline='', encoding='utf-8') as f:
+                    self.columns = next(csv.reader(f, **self.fmtparams), None)
+            self.columns = self.columns or list(records[0])
+            self._file = open(self.path, 'a', newline='', encoding='utf-8')
+            self._writer = csv.DictWriter(self._file, self.columns, extrasaction='ignore', **self.fmtparams)
+            if new_file:
+                self._writer.writeheader()
+        if not self._warned and any(key not in self._writer.fieldnames for record in records for key in record):
+            warnings.warn(f'Records contain keys that are not in the CSV header of {self.path}, '
+                          f'these values are dropped.', UserWarning)
+            self._warned = True
+        self._writer.writerows(records)
+        self._file.flush()
+        if self.fsync:
+            os.fsync(self._file.fileno())
+
+    def _close(self):
+        if self._file is not None:
+            self._file.close()
+
+
+class JSONLSink(Sink):
+    '''
+    Appends records to a JSON Lines file, values that are not JSON serializable are written as strings
+    '''
+    def __init__(self, path, batch_size=1000, flush_interval=5.0, columns=None, fsync=False):
+        super(JSONLSink, self).__init__(path, batch_size, flush_interval, columns)
+        self.fsync = fsync
+        self._file = open(path, 'a', encoding='utf-8')
+
+    def _write_batch(self, records):
+        self._file.write(''.join(json.dumps(record, default=str) + '\n' for record in records))
+        self._file.flush()
+        if self.fsync:
+            os.fsync(self._file.fileno())
+
+    def _close(self):
+        self._file.close()
+
+
+class SQLiteSink(Sink):
+    '''
+    Inserts records into an SQLite table, one transaction per batch
+    The table is created from the first batch and new keys are added as columns, nested values are stored as JSON
+    '''
+    def __init__(self, path, table='records', batch_size=1000, flush_interval=5.0, columns=None):
+        super(SQLiteSink, self).__init__(path, batch_size, flush_interval, columns)
+        if not table.replace('_', '').isalnum():
+            raise ValueError(f'Invalid table name "{table}".')
+        self.table = table
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._table_columns = [row[1] for row in self._conn.execute(f'PRAGMA table_info("{table}")')]
+
+    @staticmethod
+    def _value(value):
+        if value is None or isinstance(value, (int, float, str, bytes)):
+            return value
+        if hasattr(value, 'item') and not hasattr(value, '__len__'):
+            return value.item()
+        return json.dumps(value, default=str)
+
+    def _write_batch(self, records):
+        columns = list(dict.fromkeys(key for record in records for key in record))
+        with self._conn:
+            if not self._table_columns:
+                self._conn.execute(f'CREATE TABLE IF NOT EXISTS "{self.table}" '
+                                   f'({", ".join(_quote(c) for c in columns)})')
+                self._table_columns = columns
+            for column in columns:
+                if column not in self._table_columns:
+                    self._conn.execute(f'ALTER TABLE "{self.table}" ADD COLUMN {_quote(column)}')
+                    self._table_columns.append(column)
+            self._conn.executemany(f'INSERT INTO "{self.table}" ({", ".join(_quote(c) for c in columns)}) '
+                                   f'VALUES ({", ".join("?" * len(columns))})',
+                                   [[self._value(record.get(c)) for c in columns] for record in records])
+
+    def _close(self):
+        self._conn.close()
+
+
+class ParquetSink(Sink):
+    '''
+    Writes every batch as a separate part file in the folder path, readable as one dataset with
+    pandas.read_parquet(path). Needs the optional pyarrow package.
+    Without an explicit pyarrow schema the schema is inferred and widened as batches come in, e.g. a column
+    that was all None in the first batch takes the type of later values. All parts always share one schema
+    (dataset_schema): when a batch widens it, the parts written before are rewritten to the wider schema.
+    '''
+    def __init__(self, path, batch_size=10000, flush_interval=30.0, columns=None, compression='snappy', schema=None):
+        if importlib.util.find_spec('pyarrow') is None:
+            raise ImportError('ParquetSink needs pyarrow, install it with "pip install pyarrow".')
+        super(ParquetSink, self).__init__(path, batch_size, flush_interval, columns)
+        self.compression = compression
+        self.schema = schema
+        self._schema = schema
+        os.makedirs(path, exist_ok=True)
+        parts = [int(match.group(1)) for match in map(re.compile(r'part-(\d+)\.parquet$').match, os.listdir(path))
+                 if match]
+        self._part = max(parts) + 1 if parts else 0
+        self._parts = [os.path.join(path, f'part-{part:05d}.parquet') for part in sorted(parts)]
+        if self._parts and schema is None:
+            import pyarrow.parquet as pq
+
+            # Parts from an earlier run are part of the same dataset
+            for part_path in self._parts:
+                self._schema = self._unify(pq.read_schema(part_path))
+
+    @property
+    def dataset_schema(self):
+        '''
+        The schema shared by all parts written so far, None before the first write
+        '''
+        return self._schema
+
+    def _unify(self, schema):
+        import pyarrow as pa
+
+        if self._schema is None:
+            return schema
+        try:
+            return pa.unify_schemas([self._schema, schema], promote_options='permissive')
+        except TypeError:
+            # pyarrow before 14 only unifies null columns with other types
+            return pa.unify_schemas([self._schema, schema])
+
+    def _write_part(self, table, part_path):
+        import pyarrow.parquet as pq
+
+        pq.write_table(table, part_path + '.tmp', compression=self.compression)
+        os.replace(part_path + '.tmp', part_path)
+
+    def _rewrite_parts(self, schema):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        # Readers take the schema of one part and cannot cast e.g. string to null, so older parts are widened
+        for part_path in self._parts:
+            table = pq.read_table(part_path)
+            if table.schema.equals(schema):
+                continue
+            columns = [table[field.name].cast(field.type) if field.name in table.column_names
+                       else pa.nulls(table.num_rows, field.type) for field in schema]
+            self._write_part(pa.Table.from_arrays(columns, schema=schema), part_path)
+
+    def _write_batch(self, records):
+        import pyarrow as pa
+
+        if self.schema is not None:
+            table = pa.Table.from_pylist(records, schema=self.schema)
+        else:
+            schema = self._unify(pa.Table.from_pylist(records).schema)
+            table = pa.Table.from_pylist(records, schema=schema)
+            if self._schema is not None and not schema.equals(self._schema):
+                self._rewrite_parts(schema)
+            self._schema = schema
+        part_path = os.path.join(self.path, f'part-{self._part:05d}.parquet')
+        self._write_part(table, part_path)
+        self._parts.append(part_path)
+        self._part += 1
+
+
+def _quote(column) -> str:
+    return '"' + str(column).replace('"', '""') + '"'
@@ -0,0 +1,130 @@
+import asyncio
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+from selenium.common.exceptions import TimeoutException
+
+from actions import ActionBatch
+from async_browser import async_browser
+
+
+class ChromedriverStandIn(ThreadingHTTPServer):
+    '''
+    Local stand-in for chromedriver answering W3C WebDriver commands with canned values
+    responses maps (method, path after the session id) to a value or to an (status, error) tuple
+    '''
+    def __init__(self):
+        super(ChromedriverStandIn, self).__init__(('127.0.0.1', 0), StandInHandler)
+        self.requests = []
+        self.responses = {('POST', '/timeouts'): None}
+
+    @property
+    def url(self):
+        return f'http://127.0.0.1:{self.server_address[1]}'
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        self._respond()
+
+    def do_POST(self):
+        self._respond()
+
+    def do_DELETE(self):
+        self._respond()
+
+    def _respond(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        payload = json.loads(self.rfile.read(length)) if length else None
+        path = self.path.split('/session/stand-in', 1)[-1]
+        self.server.requests.append((self.command, path, payload))
+        status, value = 200, None
+        if self.command == 'POST' and self.path == '/session':
+            value = {'sessionId': 'stand-in', 'capabilities': payload['capabilities']['alwaysMatch']}
+        elif (self.command, path) in self.server.responses:
+            value = self.server.responses[(self.command, path)]
+            if isinstance(value, tuple):
+                status, value = value[0], {'error': value[1], 'message': value[1]}
+        else:
+            status, value = 404, {'error': 'unknown command', 'message': path}
+        body = json.dumps({'value': value}).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def chromedriver():
+    server = ChromedriverStandIn()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def test_async_browser_session(chromedriver):
+    '''
+    The session is created with the browser options, which are built off the event loop thread
+    '''
+    threads = []
+
+    def user_agent():
+        threads.append(threading.current_thread())
+        return 'test-agent'
+
+    async def main():
+        driver = await async_browser(user_agent=user_agent, server_url=chromedriver.url)
+        driver._connection.close()
+        return driver
+
+    driver = asyncio.run(main())
+    assert driver.session_id == 'stand-in'
+    assert threads and threads[0] is not threading.main_thread()
+    assert 'user-agent=test-agent' in driver.capabilities['goog:chromeOptions']['args']
+
+
+def test_wait_until_ready_restores_script_timeout(chromedriver):
+    '''
+    A wait longer than the script timeout raises it and restores it afterwards, also when the wait fails
+    '''
+    async def main():
+        driver = await async_browser(user_agent='test-agent', server_url=chromedriver.url)
+        chromedriver.responses[('POST', '/execute/async')] = True
+        assert await driver.wait_until_ready(timeout=40)
+        chromedriver.responses[('POST', '/execute/async')] = (500, 'script timeout')
+        with pytest.raises(TimeoutException):
+            await driver.wait_until_ready(timeout=40)
+        driver._connection.close()
+        return driver
+
+    driver = asyncio.run(main())
+    assert [payload for method, path, payload in chromedriver.requests if path == '/timeouts'] == \
+        [{'script': 45000}, {'script': 30000}] * 2
+    assert driver.script_timeout == 30
+
+
+def test_action_batch_restores_script_timeout(chromedriver):
+    '''
+    ActionBatch.run_async() restores the script timeout it raised for a long batch
+    '''
+    async def main():
+        driver = await async_browser(user_agent='test-agent', server_url=chromedriver.url)
+        chromedriver.responses[('POST', '/execute/async')] = {'results': [], 'next': 1, 'reason': 'done'}
+        await ActionBatch().wait(40).run_async(driver)
+        driver._connection.close()
+        return driver
+
+    driver = asyncio.run(main())
+    timeouts = [payload for method, path, payload in chromedriver.requests if path == '/timeouts']
+    assert timeouts[0]['script'] > 30000 and timeouts[-1] == {'script': 30000}
+    assert driver.script_timeout == 30
@@ -0,0 +1,31 @@
+from selenium.webdriver.chrome.webdriver import WebDriver
+
+from custom_chromedriver import NETWORK_TRACKER_SCRIPT, Browser, browser_options
+
+
+def test_browser_construction(monkeypatch):
+    '''
+    Browser.__init__ must not assign attributes that are read-only on WebDriver (like log_types)
+    '''
+    monkeypatch.setattr(WebDriver, '__init__', lambda self, *args, **kwargs: None)
+    options, capabilities = browser_options(user_agent='test-agent', performance_log=True)
+    driver = Browser(options=options, desired_capabilities=capabilities)
+    assert driver._log_sources == ['browser', 'performance']
+    assert driver.navigations == 0
+    assert len(driver.logs) == 0
+
+
+def test_track_network_registers_once(monkeypatch):
+    '''
+    The network tracker is added to new documents once per session, before the first navigation
+    '''
+    monkeypatch.setattr(WebDriver, '__init__', lambda self, *args, **kwargs: None)
+    options, capabilities = browser_options(user_agent='test-agent')
+    driver = Browser(options=options, desired_capabilities=capabilities)
+    commands = []
+    monkeypatch.setattr(driver, 'execute_cdp_cmd', lambda cmd, params: commands.append((cmd, params)) or
+                        {'identifier': '1'})
+    driver.track_network()
+    driver.track_network()
+    assert commands == [('Page.addScriptToEvaluateOnNewDocument', {'source': NETWORK_TRACKER_SCRIPT})]
+    assert driver._network_hook == '1'
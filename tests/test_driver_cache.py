@@ -0,0 +1,108 @@
+import io
+import json
+import multiprocessing
+import os
+import sys
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from zipfile import ZipFile
+
+import pytest
+from selenium.common.exceptions import WebDriverException
+
+from driver_cache import DRIVER_NAME, INDEX_FILE, cached_drivers, chromedriver_path, driver_platform, \
+    install_chromedriver
+
+
+class MirrorStandIn(ThreadingHTTPServer):
+    '''
+    Local stand-in for the Chrome for Testing mirror serving the version index and a ChromeDriver archive
+    '''
+    def __init__(self):
+        super(MirrorStandIn, self).__init__(('127.0.0.1', 0), MirrorHandler)
+        self.requests = []
+        buffer = io.BytesIO()
+        with ZipFile(buffer, 'w') as archive:
+            archive.writestr(f'chromedriver-{driver_platform()}/{DRIVER_NAME}', b'#!/bin/sh\n')
+        self.archive = buffer.getvalue()
+
+    @property
+    def url(self):
+        return f'http://127.0.0.1:{self.server_address[1]}'
+
+    def index(self) -> bytes:
+        download = {'platform': driver_platform(), 'url': f'{self.url}/chromedriver.zip'}
+        return json.dumps({'milestones': {'120': {'version': '120.0.6099.109',
+                                                  'downloads': {'chromedriver': [download]}}}}).encode()
+
+
+class MirrorHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        self.server.requests.append(self.path)
+        if self.path == f'/{INDEX_FILE}':
+            body = self.server.index()
+        elif self.path == '/chromedriver.zip':
+            body = self.server.archive
+        else:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def mirror():
+    server = MirrorStandIn()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def test_chromedriver_path_installs_once(mirror, tmp_path):
+    '''
+    A missing driver is downloaded from the mirror, unpacked as an executable and reused afterwards
+    '''
+    path = chromedriver_path('120.0.6099.71', offline=False, mirror=mirror.url, folder=str(tmp_path))
+    assert path == os.path.join(str(tmp_path), '120', DRIVER_NAME)
+    assert os.access(path, os.X_OK)
+    assert (tmp_path / '120' / 'VERSION').read_text() == '120.0.6099.109'
+    assert chromedriver_path('120', offline=False, mirror=mirror.url, folder=str(tmp_path)) == path
+    assert mirror.requests == [f'/{INDEX_FILE}', '/chromedriver.zip']
+
+
+def test_chromedriver_path_unknown_version(mirror, tmp_path):
+    with pytest.raises(WebDriverException, match='Chrome 121'):
+        chromedriver_path('121', offline=False, mirror=mirror.url, folder=str(tmp_path))
+
+
+@pytest.mark.skipif(sys.platform.startswith('win'), reason='needs fork to share the mirror with the workers')
+def test_install_chromedriver_across_processes(mirror, tmp_path):
+    '''
+    Processes installing the same version at the same time download it once
+    '''
+    with ProcessPoolExecutor(4, mp_context=multiprocessing.get_context('fork')) as pool:
+        paths = list(pool.map(install_chromedriver, [120] * 8, [mirror.url] * 8, [str(tmp_path)] * 8))
+    assert set(paths) == {os.path.join(str(tmp_path), '120', DRIVER_NAME)}
+    assert mirror.requests.count('/chromedriver.zip') == 1
+
+
+def test_chromedriver_path_offline(mirror, tmp_path):
+    '''
+    Offline, a cached driver for another Chrome version is only used with fallback=True
+    '''
+    install_chromedriver(120, mirror.url, str(tmp_path))
+    requests = len(mirror.requests)
+    with pytest.raises(WebDriverException, match='Chrome 121 is not cached.*Chrome 120'):
+        chromedriver_path('121', offline=True, mirror=mirror.url, folder=str(tmp_path))
+    with pytest.warns(UserWarning, match='Chrome 120 instead'):
+        path = chromedriver_path('121', offline=True, mirror=mirror.url, folder=str(tmp_path), fallback=True)
+    assert path == cached_drivers(str(tmp_path))[120]
+    assert len(mirror.requests) == requests
@@ -0,0 +1,53 @@
+import json
+import time
+
+import pytest
+
+from sinks import JSONLSink, ParquetSink, Sink
+
+
+def test_parquet_sink_widened_schema(tmp_path):
+    '''
+    Parts written before the schema was widened must stay readable as one dataset
+    '''
+    pd = pytest.importorskip('pandas')
+    pytest.importorskip('pyarrow')
+    with ParquetSink(str(tmp_path), batch_size=2) as sink:
+        sink.write_many([{'a': 1, 'b': None}] * 2 + [{'a': 3, 'b': 'x', 'c': 1.5}] * 2)
+    df = pd.read_parquet(str(tmp_path))
+    assert list(df.columns) == ['a', 'b', 'c']
+    assert df['b'].tolist()[2:] == ['x', 'x']
+    assert str(sink.dataset_schema.field('b').type) == 'string'
+
+
+def test_sink_flushes_on_interval(tmp_path):
+    '''
+    A buffered record is written after flush_interval even when no further records arrive
+    '''
+    path = tmp_path / 'records.jsonl'
+    with JSONLSink(str(path), batch_size=100, flush_interval=0.1) as sink:
+        sink.write({'url': 'https://example.com'})
+        time.sleep(0.5)
+        assert sink.written == 1
+        assert path.read_text(encoding='utf-8') == '{"url": "https://example.com"}\n'
+
+
+def test_sink_spills_rejected(tmp_path):
+    '''
+    Rejected records beyond max_rejected are moved from memory to rejected_path
+    '''
+    class FailingSink(Sink):
+        max_rejected = 3
+
+        def _write_batch(self, records):
+            raise OSError('disk full')
+
+    sink = FailingSink(str(tmp_path / 'records'), batch_size=2, flush_interval=None)
+    for index in range(4):
+        try:
+            sink.write({'index': index})
+        except OSError:
+            pass
+    assert [record['index'] for record in sink.rejected] == [1, 2, 3]
+    with open(sink.rejected_path, encoding='utf-8') as f:
+        assert [json.loads(line) for line in f] == [{'index': 0}]